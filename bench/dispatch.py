@@ -0,0 +1,80 @@
+""" Measures how many messages per second ``consumers.process_message``
+dispatches, compared with the former scan over the consumer classes.
+
+    python -m hpxqt.bench.dispatch [--count N]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from PyQt5 import QtWidgets
+
+from hpxqt import consumers as hpxqt_consumers
+from hpxqt import replay as hpxqt_replay
+from hpxqt import utils as hpxqt_utils
+
+
+MESSAGES = (
+    {b'kind': b'pong', b'data': {b'timestamp': 0}},
+    {b'kind': b'info_balance', b'data': {b'balance_amount': 12345}},
+)
+
+
+def scan_dispatch(msg):
+    """ Dispatches ``msg`` the way it was done before the consumer table:
+    a scan over the consumer classes, three application lookups and a
+    new consumer per message.
+    """
+    kind = msg[b'kind'].decode()
+    for consumer_cls in hpxqt_consumers.REGISTERED_CONSUMERS.values():
+        if consumer_cls.KIND == kind:
+            break
+    else:
+        return
+
+    hpxqt_consumers.Consumer(hpxqt_utils.get_login_window(),
+                             hpxqt_utils.get_system_tray(),
+                             hpxqt_utils.get_chainprox_manager())
+
+    consumer = hpxqt_consumers.get_consumer(msg[b'kind'])
+    payload = consumer.prepare(msg[b'data'])
+    if payload is not None:
+        return consumer.dispatch(payload)
+
+
+def measure(dispatch, msg, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        dispatch(msg)
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark message dispatch.')
+    parser.add_argument('--count', type=int, default=200000,
+                        help='messages per kind and dispatcher')
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QtWidgets.QApplication(sys.argv)
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+    app._chainprox_login_window = hpxqt_replay.StubWindow()
+    app._chainprox_system_tray = hpxqt_replay.StubTray()
+    app._chainprox_manager = hpxqt_replay.StubManager(
+        hpxqt_replay.StubDatabaseManager())
+    hpxqt_consumers.bind_consumers(app._chainprox_login_window,
+                                   app._chainprox_system_tray,
+                                   app._chainprox_manager)
+
+    for msg in MESSAGES:
+        scan = measure(scan_dispatch, msg, args.count)
+        table = measure(hpxqt_consumers.process_message, msg, args.count)
+        print('%-14s scan: %9.0f msg/s  table: %9.0f msg/s  (x%.1f)'
+              % (msg[b'kind'].decode(), scan, table, table / scan))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+""" Measures the download throughput of ``upgrade.Downloader`` against a
+local HTTP server, compared with reading the response in 1 KB chunks and
+hashing the file in a second pass, as updates were downloaded before.
+
+    python -m hpxqt.bench.download [--size MB] [--no-ranges]
+
+The server runs in its own process, so it does not compete with the
+download for the GIL.
+"""
+import argparse
+import asyncio
+import hashlib
+import http.server
+import multiprocessing
+import os
+import re
+import socket
+import sys
+import tempfile
+import time
+
+from hpxqt import net as hpxqt_net
+from hpxqt import upgrade as hpxqt_upgrade
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    data = b''
+    ranges = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start, status = 0, 200
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+        if match and self.ranges:
+            start, status = int(match.group(1)), 206
+
+        body = memoryview(self.data)[start:]
+        self.send_response(status)
+        if status == 206:
+            self.send_header('Content-Range', 'bytes %d-%d/%d'
+                             % (start, len(self.data) - 1, len(self.data)))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except OSError:
+            pass
+
+
+def _serve(sock, data, ranges):
+    _Handler.data = data
+    _Handler.ranges = ranges
+    server = http.server.ThreadingHTTPServer(sock.getsockname(), _Handler,
+                                             bind_and_activate=False)
+    server.socket = sock
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+async def download_chunked(url, path):
+    """ 1 KB reads and a second pass over the file for the digest.
+    """
+    async with hpxqt_net.get_session().get(url) as response:
+        with open(path, 'wb') as f:
+            while True:
+                chunk = await response.content.read(1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def download(url, path, sha256):
+    downloader = hpxqt_upgrade.Downloader(url, path, sha256=sha256)
+    failed = []
+    downloader.signal_download_failed.connect(failed.append)
+    await downloader.start()
+    if failed:
+        raise hpxqt_upgrade.DownloadError(failed[0])
+    return downloader.connections
+
+
+async def run(url, data, sha256):
+    size_mb = len(data) / 2 ** 20
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'update')
+
+        started = time.perf_counter()
+        digest = await download_chunked(url, path)
+        elapsed = time.perf_counter() - started
+        assert digest == sha256
+        print('1 KB reads + second pass hash: %6.0f MB/s' % (size_mb / elapsed))
+        os.remove(path)
+
+        started = time.perf_counter()
+        connections = await download(url, path, sha256)
+        elapsed = time.perf_counter() - started
+        with open(path, 'rb') as f:
+            assert f.read() == data
+        print('Downloader:                    %6.0f MB/s (%s)'
+              % (size_mb / elapsed, '%d connections' % connections
+                 if connections else 'single stream'))
+
+    await hpxqt_net.close_session()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark update downloads.')
+    parser.add_argument('--size', type=int, default=100, help='file size in MB')
+    parser.add_argument('--no-ranges', action='store_true',
+                        help='serve without Range support, on one connection')
+    args = parser.parse_args()
+
+    data = os.urandom(args.size * 2 ** 20)
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(16)
+    server = multiprocessing.Process(target=_serve,
+                                     args=(sock, data, not args.no_ranges),
+                                     daemon=True)
+    server.start()
+
+    try:
+        url = 'http://127.0.0.1:%d/update' % sock.getsockname()[1]
+        asyncio.run(run(url, data, sha256))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+""" Checks that ``upgrade.extract_archive`` refuses unsafe archives and
+measures it on an archive with many members, compared with validating
+``getmembers()`` by string prefix and calling ``extractall()``, as update
+archives were extracted before.
+
+    python -m hpxqt.bench.extract [--members N]
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+
+from hpxqt import upgrade as hpxqt_upgrade
+
+
+def make_archive(fileobj, entries, mode='w'):
+    """ Writes a tar archive of ``(name, type, value)`` entries, the value
+    being the content of a file or the target of a link.
+    """
+    with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+        for name, member_type, value in entries:
+            member = tarfile.TarInfo(name)
+            member.type = member_type
+            if member_type == tarfile.REGTYPE:
+                member.size = len(value)
+                tar.addfile(member, io.BytesIO(value))
+                continue
+
+            if member_type == tarfile.DIRTYPE:
+                member.mode = 0o755
+            elif member_type in (tarfile.SYMTYPE, tarfile.LNKTYPE):
+                member.linkname = value
+            tar.addfile(member)
+
+
+def unsafe_archives(victim):
+    """ Entries of archives which must be refused, by case. ``victim`` is
+    the absolute path of a file outside of the destination.
+    """
+    victim_dir, victim_name = os.path.split(victim)
+    return {
+        'parent path': [('../evil', tarfile.REGTYPE, b'x')],
+        'absolute path': [(victim, tarfile.REGTYPE, b'x')],
+        'absolute symlink': [('app/x', tarfile.SYMTYPE, victim)],
+        'file over absolute symlink': [
+            ('app/x', tarfile.SYMTYPE, victim),
+            ('app/x', tarfile.REGTYPE, b'x'),
+        ],
+        'file over symlink': [
+            ('app/x', tarfile.SYMTYPE, 'y'),
+            ('app/x', tarfile.REGTYPE, b'x'),
+        ],
+        'symlink out of root': [('app/x', tarfile.SYMTYPE, '../../etc')],
+        'file through symlink': [
+            ('app/l', tarfile.SYMTYPE, '.'),
+            ('app/l/x', tarfile.REGTYPE, b'x'),
+        ],
+        'parent through symlink': [
+            ('l', tarfile.SYMTYPE, '.'),
+            ('m', tarfile.SYMTYPE, 'l/../' + victim_name),
+        ],
+        'hardlink out of root': [('h', tarfile.LNKTYPE, '../' + victim_name)],
+        'absolute hardlink': [('h', tarfile.LNKTYPE, victim)],
+        'device': [('dev', tarfile.CHRTYPE, None)],
+        'fifo': [('fifo', tarfile.FIFOTYPE, None)],
+    }
+
+
+def check_rejections():
+    """ Extracts every unsafe archive. Returns the cases which were not
+    refused or changed the victim file.
+    """
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        victim = os.path.join(tmp_dir, 'victim')
+        for case, entries in unsafe_archives(victim).items():
+            with open(victim, 'wb') as f:
+                f.write(b'victim')
+
+            archive = io.BytesIO()
+            make_archive(archive, entries)
+            archive.seek(0)
+
+            path = tempfile.mkdtemp(dir=tmp_dir)
+            try:
+                with tarfile.open(fileobj=archive, mode='r|*') as tar:
+                    hpxqt_upgrade.extract_archive(tar, path)
+                refused = False
+            except hpxqt_upgrade.ArchiveError:
+                refused = True
+
+            with open(victim, 'rb') as f:
+                intact = f.read() == b'victim'
+            print('%-28s %s' % (case, 'refused' if refused and intact else 'NOT REFUSED'))
+            if not refused or not intact:
+                failed.append(case)
+    return failed
+
+
+def extract_by_prefix(archive, path):
+    with tarfile.open(archive) as tar:
+        abs_path = os.path.abspath(path)
+        for member in tar.getmembers():
+            member_path = os.path.abspath(os.path.join(path, member.name))
+            if os.path.commonprefix([abs_path, member_path]) != abs_path:
+                raise Exception("Attempted Path Traversal in Tar File")
+        tar.extractall(path)
+        return os.path.join(path, tar.getnames()[-1])
+
+
+def extract_single_pass(archive, path):
+    with tarfile.open(archive, mode='r|*') as tar:
+        return hpxqt_upgrade.extract_archive(tar, path)
+
+
+def measure(extract, archive, tmp_dir):
+    """ Returns the time ``extract`` takes and its peak memory, measured
+    in a second run as tracemalloc slows it down.
+    """
+    path = tempfile.mkdtemp(dir=tmp_dir)
+    started = time.perf_counter()
+    extract(archive, path)
+    elapsed = time.perf_counter() - started
+    shutil.rmtree(path)
+
+    path = tempfile.mkdtemp(dir=tmp_dir)
+    tracemalloc.start()
+    extract(archive, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    shutil.rmtree(path)
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark update archive extraction.')
+    parser.add_argument('--members', type=int, default=100000,
+                        help='files in the benchmark archive')
+    args = parser.parse_args()
+
+    failed = check_rejections()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive = os.path.join(tmp_dir, 'update.tar.gz')
+        dirs = ['chainprox/d%03d' % i for i in range(100)]
+        entries = [(name, tarfile.DIRTYPE, None) for name in dirs]
+        entries += [('%s/f%06d' % (dirs[i % len(dirs)], i), tarfile.REGTYPE, b'%d' % i)
+                    for i in range(args.members)]
+        with open(archive, 'wb') as f:
+            make_archive(f, entries, mode='w:gz')
+        del entries
+
+        for label, extract in (('getmembers + extractall', extract_by_prefix),
+                               ('extract_archive', extract_single_pass)):
+            elapsed, peak = measure(extract, archive, tmp_dir)
+            print('%-24s %d members: %6.1fs, peak %6.1f MB'
+                  % (label, args.members, elapsed, peak / 2 ** 20))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
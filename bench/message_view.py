@@ -0,0 +1,69 @@
+""" Measures reading a version manifest through ``utils.MessageView``,
+compared with decoding the whole message with ``utils.convert_bytes``.
+
+    python -m hpxqt.bench.message_view [--binaries N] [--number N]
+"""
+import argparse
+import sys
+import timeit
+
+from hpxqt import utils as hpxqt_utils
+
+
+PLATFORMS = (b'linux', b'windows', b'osx')
+ARCHS = (b'x86_64', b'i386')
+
+
+def make_manifest(count):
+    """ Returns a raw ``info_version`` message announcing ``count``
+    binaries.
+    """
+    binaries = []
+    for i in range(count):
+        platform = PLATFORMS[i % len(PLATFORMS)]
+        arch = ARCHS[i // len(PLATFORMS) % len(ARCHS)]
+        release = b'1.%d.0' % (i // (len(PLATFORMS) * len(ARCHS)))
+        binaries.append({
+            b'platform': platform,
+            b'arch': arch,
+            b'version': release,
+            b'file': b'https://chainprox.com/media/releases/chainprox-%s-%s-%s.tar.gz'
+                     % (release, platform, arch),
+            b'sha256': b'ab' * 32,
+            b'channel': b'stable',
+        })
+    return {b'version': b'1.0.1', b'binaries': binaries}
+
+
+def read_version(convert, msg):
+    return convert(msg)['version']
+
+
+def scan_binaries(convert, msg):
+    return [(binary['platform'], binary['arch'])
+            for binary in convert(msg)['binaries']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark manifest decoding.')
+    parser.add_argument('--binaries', type=int, default=1000,
+                        help='binaries in the manifest')
+    parser.add_argument('--number', type=int, default=200,
+                        help='reads per measurement')
+    args = parser.parse_args()
+
+    msg = make_manifest(args.binaries)
+    assert (scan_binaries(hpxqt_utils.convert_bytes, msg)
+            == scan_binaries(hpxqt_utils.MessageView, msg))
+
+    for label, read in (('version only', read_version),
+                        ('platform/arch scan', scan_binaries)):
+        timings = [timeit.timeit(lambda: read(convert, msg), number=args.number)
+                   / args.number
+                   for convert in (hpxqt_utils.convert_bytes, hpxqt_utils.MessageView)]
+        print('%-18s convert_bytes: %9.1f us  MessageView: %9.1f us  (x%.0f)'
+              % (label, timings[0] * 1e6, timings[1] * 1e6, timings[0] / timings[1]))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
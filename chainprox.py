@@ -4,7 +4,6 @@ import urllib.parse
 import asyncio
 import functools
 
-import requests
 import qasync
 
 from qasync import asyncSlot
@@ -14,8 +13,14 @@ from PyQt5.QtWidgets import QApplication
 from hpxclient import daemon as hpxclient_daemon
 from hpxclient import settings
 from hpxqt import consts as hpxqt_consts
+from hpxqt import consumers as hpxqt_consumers
 from hpxqt import db as hpxqt_db
+from hpxqt import history as hpxqt_history
 from hpxqt import mng as hpxqt_mng
+from hpxqt import net as hpxqt_net
+from hpxqt import pipeline as hpxqt_pipeline
+from hpxqt import replay as hpxqt_replay
+from hpxqt import upgrade as hpxqt_upgrade
 from hpxqt import utils as hpxqt_utils
 
 # Required for QtGui.QPixmap to work
@@ -23,11 +28,28 @@ from hpxqt import hpximg
 
 
 class ChainproxManager(QtCore.QObject):
-    def __init__(self):
+    """ Manager of one account. The manager of the account logged in
+    through the window owns the managers of the additional ``accounts``,
+    which share its database and message pipeline.
+    """
+
+    def __init__(self, account=None, db_manager=None, pipeline=None):
         super().__init__()
 
-        self.db_manager = hpxqt_db.DatabaseManager()
-        self.db_manager.initialize()
+        if db_manager is None:
+            db_manager = hpxqt_db.DatabaseManager()
+            db_manager.initialize()
+        self.db_manager = db_manager
+
+        self.pipeline = pipeline or hpxqt_pipeline.MessagePipeline()
+        self.clients = hpxqt_mng.ClientManager()
+
+        # Additional accounts have their own consumers, the default
+        # consumer table is used otherwise.
+        self.account = account
+        self.history_path = hpxqt_history.get_history_file_path(account)
+        self.consumers = None
+        self.accounts = []
 
         self._login = None
         self._password = None
@@ -36,13 +58,64 @@ class ChainproxManager(QtCore.QObject):
         self._login = login
         self._password = password
 
-        await hpxqt_mng.start_manager(login, password, proxy_enabled=settings.PROXY_SSL_ENABLED)
+        message_handler = self.pipeline.submit
+        if self.consumers is not None:
+            message_handler = functools.partial(message_handler,
+                                                consumers=self.consumers)
+
+        recorder = hpxqt_replay.get_recorder()
+        if recorder is not None:
+            message_handler = recorder.wrap(message_handler,
+                                            account=self.account)
+
+        await self.clients.start(login, password,
+                                 message_handler=message_handler,
+                                 proxy_enabled=settings.PROXY_SSL_ENABLED)
+
+    def add_account(self, login, password, login_window, system_tray):
+        """ Starts the manager of an additional account.
+        """
+        manager = ChainproxManager(account=login,
+                                   db_manager=self.db_manager,
+                                   pipeline=self.pipeline)
+        manager.consumers = hpxqt_consumers.ConsumerTable(login_window,
+                                                          system_tray,
+                                                          manager)
+        self.accounts.append(manager)
+        asyncio.ensure_future(manager.start_manager(login, password))
+        return manager
 
     def stop_manager(self):
-        hpxqt_mng.stop_manager()
+        return self.clients.stop()
+
+    def connection_stats(self):
+        return self.clients.stats()
+
+    def tls_stats(self):
+        return self.clients.tls_stats()
 
     def close(self, *args):
+        for manager in self.accounts:
+            manager.stop_manager()
+            manager.consumers.close()
+
         self.stop_manager()
+        self.pipeline.shutdown()
+        hpxqt_consumers.close_consumers()
+        hpxqt_replay.close_recorder()
+
+        # A running extraction would keep the executor, and so the
+        # application, from shutting down.
+        window = hpxqt_utils.get_login_window()
+        if isinstance(window, hpxqt_upgrade.WindowUpdateMixIn):
+            window.cancel_upgrade()
+        asyncio.ensure_future(self._quit())
+
+    @staticmethod
+    async def _quit():
+        # The event loop stops with the application, so the session
+        # must be closed before.
+        await hpxqt_net.close_session()
         QtWidgets.QApplication.instance().quit()
 
     def save_credentials(self):
@@ -54,7 +127,7 @@ class ChainproxManager(QtCore.QObject):
             password=self._password)
 
     def delete_credentials(self):
-        self.db_manager.delete_user()
+        self.db_manager.delete_user(self._login)
 
 
 class QObjectMixIn(object):
@@ -97,11 +170,11 @@ class Router(QObjectMixIn, QtCore.QObject):
         """
         await self.window.chainprox_manager.start_manager(email, password)
 
-    @QtCore.pyqtSlot(str)
-    def js_handler_reset_password(self, email):
+    @asyncSlot(str)
+    async def js_handler_reset_password(self, email):
         url = urllib.parse.urljoin(hpxqt_consts.URL_PREFIX,
                                    "api/account/password/reset/")
-        requests.post(url, data=dict(email=email))
+        await hpxqt_net.post(url, data=dict(email=email))
 
     @QtCore.pyqtSlot(str)
     def js_open_url(self, url):
@@ -148,7 +221,7 @@ class WebWindowView(QObjectMixIn, QtWebEngineWidgets.QWebEngineView):
 
         if close == QtWidgets.QMessageBox.Yes:
             event.accept()
-            QtWidgets.QApplication.instance().quit()
+            self.chainprox_manager.close()
         else:
             event.ignore()
 
@@ -163,6 +236,7 @@ class SystemTrayIcon(QObjectMixIn, QtCore.QObject):
         super().__init__()
 
         self.chainprox_manager = chainprox_manager
+        self._account_labels = {}
 
         # System try icon
         self._create_tray_icon()
@@ -174,6 +248,21 @@ class SystemTrayIcon(QObjectMixIn, QtCore.QObject):
     def open_help(self):
         self.open_url(self, 'dash/how-to-proxy/')
 
+    def set_balance(self, balance_amount, account=None):
+        """ Shows the balance of ``account``, None being the account
+        logged in through the window.
+        """
+        if account is None:
+            self.label_balance.setText("Balance: %s" % balance_amount)
+            return
+
+        label = self._account_labels.get(account)
+        if label is None:
+            label = self._account_labels[account] = QtWidgets.QAction(self)
+            label.setDisabled(True)
+            self.trayIconMenu.insertAction(self.label_latency, label)
+        label.setText("Balance (%s): %s" % (account, balance_amount))
+
     def set_status_traymenu(self, is_disabled):
         self.preference.setDisabled(is_disabled)
         self.logout.setDisabled(is_disabled)
@@ -194,6 +283,9 @@ class SystemTrayIcon(QObjectMixIn, QtCore.QObject):
         self.label_balance = QtWidgets.QAction('Balance: unknown', self)
         self.label_balance.setDisabled(True)
         self.trayIconMenu.addAction(self.label_balance)
+        self.label_latency = QtWidgets.QAction('Latency: unknown', self)
+        self.label_latency.setDisabled(True)
+        self.trayIconMenu.addAction(self.label_latency)
         self.trayIconMenu.addSeparator()
 
         self.preference = QtWidgets.QAction('Preferences', self,
@@ -242,17 +334,22 @@ async def main():
 
     tray = SystemTrayIcon(chainprox_manager)
     window = WebWindowView(chainprox_manager)
-    user = chainprox_manager.db_manager.last_user()
+    user, *other_users = chainprox_manager.db_manager.users() or [None]
+
+    app._chainprox_manager = chainprox_manager
+    app._chainprox_login_window = window
+    app._chainprox_system_tray = tray
+    hpxqt_consumers.bind_consumers(window, tray, chainprox_manager)
+
+    for other_user in other_users:
+        chainprox_manager.add_account(other_user.email, other_user.password,
+                                      window, tray)
 
     if user:
         await chainprox_manager.start_manager(user.email, user.password)
     else:
         window.show()
 
-    app._chainprox_manager = chainprox_manager
-    app._chainprox_login_window = window
-    app._chainprox_system_tray = tray
-
     await future
     return True
 
@@ -7,6 +7,82 @@ START_DOWNLOAD = 1
 FINISHED_DOWNLOAD = 2
 START_INSTALL = 3
 FINISHED_INSTALL = 4
+DOWNLOAD_PROGRESS = 5
+
+# HTTP session shared by the application, see ``net.get_session``.
+# Timeouts are in seconds.
+HTTP_POOL_SIZE = 16
+HTTP_KEEPALIVE_TIMEOUT = 30
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 60
+
+# Update downloads. Progress is saved to the database every
+# DOWNLOAD_PROGRESS_BYTES. Retries wait DOWNLOAD_RETRY_DELAY seconds,
+# doubled on every retry up to DOWNLOAD_RETRY_DELAY_MAX.
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_RETRY_DELAY = 2
+DOWNLOAD_RETRY_DELAY_MAX = 30
+DOWNLOAD_PROGRESS_BYTES = 1024 * 1024
+
+# Maximum number of download progress signals per second.
+DOWNLOAD_PROGRESS_RATE = 4
+
+# Bounds of the download chunk size in bytes. The size is adapted so a
+# chunk takes about DOWNLOAD_CHUNK_TIME seconds to read.
+DOWNLOAD_CHUNK_MIN = 64 * 1024
+DOWNLOAD_CHUNK_MAX = 4 * 1024 * 1024
+DOWNLOAD_CHUNK_TIME = 0.1
+
+# Segmented downloads. Servers supporting ranges serve downloads of at
+# least two DOWNLOAD_SEGMENT_MIN bytes over up to DOWNLOAD_SEGMENTS_MAX
+# connections. Another connection is opened every
+# DOWNLOAD_SEGMENT_INTERVAL seconds while it raises the throughput by
+# DOWNLOAD_SEGMENT_GAIN.
+DOWNLOAD_SEGMENTS_MAX = 8
+DOWNLOAD_SEGMENT_MIN = 4 * 1024 * 1024
+DOWNLOAD_SEGMENT_INTERVAL = 0.5
+DOWNLOAD_SEGMENT_GAIN = 1.1
+
+UPDATE_NO_MATCH = 1
+UPDATE_INSTALLED = 2
+UPDATE_AVAILABLE = 3
+
+# Release channel of the update binaries offered to the user.
+UPDATE_CHANNEL = 'stable'
+
+# Maximum number of balance and latency updates applied to the tray
+# per second.
+BALANCE_MAX_RATE = 2
+LATENCY_MAX_RATE = 1
+
+# Balance and latency log lines per second of the headless daemon.
+HEADLESS_LOG_RATE = 1 / 60
+
+# Number of ping round-trip times the latency percentiles are computed on.
+RTT_WINDOW_SIZE = 256
+
+# Queue policies of the consumers, see ``pipeline.MessageQueue``.
+QUEUE_KEEP = 1
+QUEUE_LATEST = 2
+QUEUE_DROP = 3
+
+# Number of messages queued before droppable ones are dropped.
+MESSAGE_QUEUE_SIZE = 1000
+
+# Seconds the manager clients get to shut down when stopped.
+MANAGER_STOP_TIMEOUT = 5
+
+# Reconnect backoff of the manager clients in seconds. The backoff starts
+# over once a connection stayed up for RECONNECT_BACKOFF_RESET seconds.
+RECONNECT_BACKOFF_MIN = 0.5
+RECONNECT_BACKOFF_MAX = 30
+RECONNECT_BACKOFF_RESET = 60
+
+# Seconds between saves of the balance history to disk.
+BALANCE_HISTORY_SAVE_INTERVAL = 60
+
+# Seconds between dumps of the dispatch metrics to the log file.
+METRICS_DUMP_INTERVAL = 300
 
 LINUX_APP_NAME = 'chainprox'
 MAC_APP_NAME = 'chainprox.app'
@@ -1,122 +1,417 @@
-import platform
-
-from PyQt5.QtCore import pyqtSlot
+import asyncio
+import logging
+import time
 
 from hpxclient.fetcher.central import consumers as fetcher_central_consumers
 from hpxclient import consts as hpxclient_consts
 from hpxclient.mng import consumers as mng_consumers
 from hpxqt import __version__ as version
 from hpxqt import consts as hpxqt_consts
+from hpxqt import history as hpxqt_history
+from hpxqt import metrics as hpxqt_metrics
 from hpxqt import utils as hpxqt_utils
 
 
+logger = logging.getLogger('hpxqt')
+
+
 class Consumer(object):
+    # Coroutine ``process`` calls of an ordered consumer run one at a
+    # time in arrival order, otherwise they run concurrently.
+    ORDERED = True
+
+    # What the pipeline queues do with a message of this kind when the
+    # consumer falls behind, see ``pipeline.MessageQueue``.
+    QUEUE_POLICY = hpxqt_consts.QUEUE_KEEP
+
     def __init__(self, login_window, system_tray, mng):
         self.login_window = login_window
         self.system_tray = system_tray
         self.mng = mng
 
+        self._last_task = None
+
+    def receive(self, msg):
+        """ Called with the raw payload of every message as it arrives,
+        before the pipeline queues may merge it with a newer one. It
+        runs on the receiving thread, so it must be cheap.
+        """
+
+    def prepare(self, msg):
+        """ Normalizes the raw message payload. It runs off the GUI
+        thread, so it must not touch widgets. Returning None skips
+        ``process``.
+        """
+        return msg
+
+    def process(self, msg):
+        pass
+
+    def close(self):
+        """ Called once when the application shuts down.
+        """
+
+    def dispatch(self, payload):
+        """ Calls ``process``. When it is a coroutine, it is scheduled on
+        the event loop and the task is returned.
+        """
+        result = self.process(payload)
+        if not asyncio.iscoroutine(result):
+            return result
+
+        if self.ORDERED:
+            result = self._run_after(self._last_task, result)
+
+        task = asyncio.ensure_future(result)
+        task.add_done_callback(self._task_done)
+        if self.ORDERED:
+            self._last_task = task
+        return task
+
+    @staticmethod
+    def run_in_executor(func, *args):
+        """ Runs blocking ``func`` in the default executor of the loop.
+        """
+        return asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+    @staticmethod
+    async def _run_after(previous, coro):
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        return await coro
+
+    def _task_done(self, task):
+        if self._last_task is task:
+            self._last_task = None
+
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Failed to process %s message', self.KIND,
+                         exc_info=task.exception())
+
+
+class LatestWinsMixIn(object):
+    """ Keeps only the newest message of a kind and applies it at most
+    ``MAX_RATE`` times per second. Subclasses implement ``apply``.
+    """
+    MAX_RATE = None
+
+    _pending = None
+    _flush_handle = None
+    _last_flush = 0.0
+
+    def process(self, msg):
+        self._pending = msg
+        if self._flush_handle is not None:
+            return
+
+        delay = 0
+        if self.MAX_RATE:
+            delay = self._last_flush + 1.0 / self.MAX_RATE - time.monotonic()
+
+        if delay <= 0:
+            self.flush()
+        else:
+            self._flush_handle = asyncio.get_event_loop().call_later(
+                delay, self.flush)
+
+    def flush(self):
+        """ Applies the pending message right away, if there is one.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        msg, self._pending = self._pending, None
+        if msg is None:
+            return
+
+        self._last_flush = time.monotonic()
+        self.apply(msg)
+
+    def apply(self, msg):
+        raise NotImplementedError
+
+
+REGISTERED_CONSUMERS = {}
+
+
+class ConsumerTable(object):
+    """ One long-lived instance of every registered consumer, bound to
+    the window, tray and manager of one account.
+    """
+
+    def __init__(self, login_window, system_tray, mng):
+        self._consumers = {
+            kind: consumer_cls(login_window, system_tray, mng)
+            for kind, consumer_cls in REGISTERED_CONSUMERS.items()
+        }
+
+    def get(self, kind):
+        """ Returns the consumer of the raw ``kind`` or None if the kind
+        is not registered.
+        """
+        return self._consumers.get(kind)
+
+    def close(self):
+        for consumer in self._consumers.values():
+            consumer.close()
+
+
+# Consumers of the account logged in through the window.
+_BOUND_CONSUMERS = None
+
+
+def register_consumer(consumer_cls):
+    """ Registers ``consumer_cls`` as the handler of its ``KIND`` messages.
+    Can be used as a class decorator.
+    """
+    global _BOUND_CONSUMERS
+
+    REGISTERED_CONSUMERS[consumer_cls.KIND.encode()] = consumer_cls
+    _BOUND_CONSUMERS = None
+    return consumer_cls
+
+
+def bind_consumers(login_window, system_tray, mng):
+    """ Creates the default consumer table and returns it.
+    """
+    global _BOUND_CONSUMERS
+
+    _BOUND_CONSUMERS = ConsumerTable(login_window, system_tray, mng)
+    return _BOUND_CONSUMERS
+
+
+def close_consumers():
+    if _BOUND_CONSUMERS is not None:
+        _BOUND_CONSUMERS.close()
 
+
+def get_consumer(kind):
+    """ Returns the default consumer of the raw ``kind`` or None if the
+    kind is not registered.
+    """
+    if kind not in REGISTERED_CONSUMERS:
+        return None
+
+    if _BOUND_CONSUMERS is None:
+        bind_consumers(hpxqt_utils.get_login_window(),
+                       hpxqt_utils.get_system_tray(),
+                       hpxqt_utils.get_chainprox_manager())
+    return _BOUND_CONSUMERS.get(kind)
+
+
+@register_consumer
 class AuthResponseConsumer(Consumer):
     KIND = fetcher_central_consumers.AuthResponseConsumer.KIND
 
-    def process(self, msg):
+    def prepare(self, msg):
         error = msg[b"error"]
+        return error.decode() if error else ''
+
+    async def process(self, error):
+        if self.mng.account is not None:
+            # Additional accounts are not logged in through the window.
+            if error:
+                logger.error('Login of %s failed: %s', self.mng.account, error)
+                await self.mng.stop_manager()
+            return
 
         if error:
             self.login_window.show()
-            self.login_window.show_error(error_msg=error.decode())
+            self.login_window.show_error(error_msg=error)
 
-            self.mng.stop_manager()
-            self.mng.delete_credentials()
+            await self.mng.stop_manager()
+            await self.run_in_executor(self.mng.delete_credentials)
         else:
-            self.mng.save_credentials()
+            await self.run_in_executor(self.mng.save_credentials)
             self.login_window.signal_minimize_tray.emit()
 
 
-class InfoBalanceConsumer(Consumer):
+@register_consumer
+class InfoBalanceConsumer(LatestWinsMixIn, Consumer):
     KIND = mng_consumers.InfoBalanceConsumer.KIND
+    QUEUE_POLICY = hpxqt_consts.QUEUE_LATEST
+    MAX_RATE = hpxqt_consts.BALANCE_MAX_RATE
 
-    def process(self, msg):
-        balance_amount = hpxqt_utils.bytes2str(msg[b"balance_amount"])
-        self.system_tray.label_balance.setText("Balance: %s" % balance_amount)
+    def __init__(self, login_window, system_tray, mng):
+        super().__init__(login_window, system_tray, mng)
+
+        # Show the newest balance as soon as the user opens the menu.
+        # The headless daemon has no tray.
+        if self.system_tray is not None:
+            self.system_tray.trayIconMenu.aboutToShow.connect(self.flush)
 
+        self.history = hpxqt_history.BalanceHistory(self.mng.history_path)
+        self.history.load()
+        self._history_saved = time.monotonic()
 
-class PongConsumer(Consumer):
+    def receive(self, msg):
+        # Every sample is recorded, even the ones merged away later.
+        self.history.add(msg[b"balance_amount"])
+
+    def prepare(self, msg):
+        balance_amount = msg[b"balance_amount"]
+
+        if time.monotonic() - self._history_saved >= hpxqt_consts.BALANCE_HISTORY_SAVE_INTERVAL:
+            self._history_saved = time.monotonic()
+            self.history.save()
+
+        return hpxqt_utils.bytes2str(balance_amount)
+
+    def apply(self, balance_amount):
+        self.system_tray.set_balance(balance_amount, account=self.mng.account)
+
+    def close(self):
+        self.history.save()
+
+
+@register_consumer
+class PongConsumer(LatestWinsMixIn, Consumer):
+    """ Tracks the ping round-trip time. Pongs echo the send time of
+    their ping in ``timestamp``.
+    """
     KIND = hpxclient_consts.PONG_KIND
+    QUEUE_POLICY = hpxqt_consts.QUEUE_DROP
+    MAX_RATE = hpxqt_consts.LATENCY_MAX_RATE
 
-    def process(self, msg):
-        pass
+    def __init__(self, login_window, system_tray, mng):
+        super().__init__(login_window, system_tray, mng)
+
+        # Written by the pipeline worker only.
+        self.rtt_window = hpxqt_metrics.RollingWindow(hpxqt_consts.RTT_WINDOW_SIZE)
+        self.rtt_stats = None
 
+        if self.system_tray is not None:
+            self.system_tray.trayIconMenu.aboutToShow.connect(self.flush)
 
+    def prepare(self, msg):
+        sent = msg.get(b"timestamp")
+        if sent is None:
+            return
+
+        self.rtt_window.add(max(time.time() - sent, 0.0))
+        self.rtt_stats = stats = dict(
+            last=self.rtt_window.last(),
+            p50=self.rtt_window.percentile(50),
+            p95=self.rtt_window.percentile(95),
+            p99=self.rtt_window.percentile(99),
+        )
+        return stats
+
+    def apply(self, stats):
+        if self.mng.account is not None:
+            return
+        self.system_tray.label_latency.setText(
+            "Latency: %d ms (p95 %d ms)" % (stats['last'] * 1000,
+                                            stats['p95'] * 1000))
+
+
+@register_consumer
 class InfoVersionConsumer(Consumer):
     KIND = mng_consumers.InfoVersionConsumer.KIND
+    QUEUE_POLICY = hpxqt_consts.QUEUE_LATEST
 
     def __init__(self, login_window, system_tray, mng):
         super().__init__(login_window, system_tray, mng)
 
         self._OS = hpxqt_utils.get_os()
-        self._ARCH = hpxqt_consts.ARCH_MAP.get(platform.architecture()[0], '')
-
-    def _save_new_version(self, binaries):
-        for binary in binaries:
-            b_platform = binary['platform'].lower()
-            b_arch = binary['arch'].lower()
-
-            if b_platform != self._OS:
-                continue
+        self._host_key = hpxqt_utils.get_host_binary_key()
 
-            if b_platform != hpxqt_consts.MAC_OS and (self._ARCH not in b_arch):
-                    continue
-            return self.login_window.router.db_manager.add_update(binary['version'],
-                                                            binary['file'],
-                                                            self._OS)
+        self._decisions = {}
+        self._decisions_generation = None
 
-    def process(self, msg):
-        msg = hpxqt_utils.convert_bytes(msg)
-        if version == msg['version']:
+    def _save_new_version(self, binaries):
+        binary = hpxqt_utils.index_binaries(binaries).get(self._host_key)
+        if binary is None:
             return
-        
-        update_ver = self.login_window.router.db_manager.get_update(msg["version"])
+        # A binary may list patches from older versions in ``deltas``,
+        # see ``hpxqt.delta``. Only a patch from this version is useful.
+        patch = next((delta for delta in binary.get('deltas', ())
+                      if delta['from'] == version), None)
+        return self.mng.db_manager.add_update(
+            binary['version'],
+            binary['file'],
+            self._OS,
+            sha256=binary.get('sha256'),
+            delta_url=patch['file'] if patch else None,
+            delta_sha256=patch.get('sha256') if patch else None)
+
+    def _resolve_update(self, msg):
+        update_ver = self.mng.db_manager.get_update(msg["version"])
         if not update_ver:
             update_ver = self._save_new_version(msg['binaries'])
             if not update_ver:
                 # There was no update matching system specification
-                return
+                return hpxqt_consts.UPDATE_NO_MATCH
 
         if update_ver.is_installed:
+            return hpxqt_consts.UPDATE_INSTALLED
+        return hpxqt_consts.UPDATE_AVAILABLE
+
+    def _get_update_decision(self, msg):
+        """ Returns the cached outcome for the advertised version. The
+        cache is dropped whenever the updates table changes.
+        """
+        db_manager = self.mng.db_manager
+        generation = db_manager.updates_generation
+        if generation != self._decisions_generation:
+            self._decisions.clear()
+            self._decisions_generation = generation
+
+        try:
+            return self._decisions[msg['version']]
+        except KeyError:
+            pass
+
+        decision = self._resolve_update(msg)
+        # Do not cache an outcome that raced with a table change.
+        if db_manager.updates_generation == generation:
+            self._decisions[msg['version']] = decision
+        return decision
+
+    def prepare(self, msg):
+        msg = hpxqt_utils.MessageView(msg)
+        if version == msg['version']:
             return
-        self.login_window.upgrade.setDisabled(False)
 
+        if self._get_update_decision(msg) != hpxqt_consts.UPDATE_AVAILABLE:
+            return
+        return msg['version']
 
-REGISTERED_CONSUMERS = [
-    AuthResponseConsumer,
-    InfoBalanceConsumer,
-    InfoVersionConsumer,
-    PongConsumer
-]
+    def process(self, update_version):
+        self.login_window.upgrade.setDisabled(False)
 
 
-@pyqtSlot(dict)
-def process_message(msg):
+def process_message(msg, consumers=None):
     """ All messages sent to the manager are also processed by
-    the ui interface.
+    the ui interface. The message is prepared and processed on the
+    calling thread, see ``hpxqt.pipeline`` for the threaded variant.
+    ``consumers`` is the ``ConsumerTable`` of the account, the default
+    table is used if it is not given.
     """
+    kind = msg[b'kind']
+    if consumers is not None:
+        consumer = consumers.get(kind)
+    else:
+        consumer = get_consumer(kind)
+
+    if consumer is None:
+        if hpxqt_metrics.DISPATCH_METRICS.record_unknown(kind):
+            logger.warning('Kind not recognized %s', kind.decode())
+        return
 
-    consumer_cls = None
-    consumer_kind = msg[b'kind'].decode()
-
-    for _consumer_cls in REGISTERED_CONSUMERS:
-        if consumer_kind == _consumer_cls.KIND:
-            consumer_cls = _consumer_cls
-            break
+    metrics = hpxqt_metrics.DISPATCH_METRICS
+    metrics.record(consumer.KIND)
+    consumer.receive(msg[b'data'])
 
-    if consumer_cls is None:
-        print('Kind not recognized %s' % consumer_kind)
+    started = time.perf_counter()
+    payload = consumer.prepare(msg[b'data'])
+    prepared = time.perf_counter()
+    metrics.observe(consumer.KIND, 'prepare', prepared - started)
+    if payload is None:
         return
 
-    window = hpxqt_utils.get_login_window()
-    system_tray = hpxqt_utils.get_system_tray()
-    mng = hpxqt_utils.get_chainprox_manager()
-
-    return consumer_cls(window, system_tray, mng).process(msg[b'data'])
+    try:
+        return consumer.dispatch(payload)
+    finally:
+        metrics.observe(consumer.KIND, 'process', time.perf_counter() - prepared)
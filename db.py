@@ -1,3 +1,4 @@
+import functools
 import os
 from datetime import datetime
 
@@ -21,35 +22,93 @@ class Upgrade(DB.Entity):
     date = pony_orm.Required(datetime, default=datetime.now)
     is_installed = pony_orm.Required(bool, default=False)
     is_downloaded = pony_orm.Required(bool, default=False)
+    download_path = pony_orm.Optional(str)
+    downloaded_bytes = pony_orm.Required(int, default=0)
+    sha256 = pony_orm.Optional(str)
+    delta_url = pony_orm.Optional(str)
+    delta_sha256 = pony_orm.Optional(str)
+
+
+# Columns added after their table was first created. They are added to
+# databases of older versions by ``DatabaseManager.initialize``.
+ADDED_COLUMNS = {
+    'Upgrade': (
+        ('download_path', "TEXT NOT NULL DEFAULT ''"),
+        ('downloaded_bytes', 'INTEGER NOT NULL DEFAULT 0'),
+        ('sha256', "TEXT NOT NULL DEFAULT ''"),
+        ('delta_url', "TEXT NOT NULL DEFAULT ''"),
+        ('delta_sha256', "TEXT NOT NULL DEFAULT ''"),
+    ),
+}
+
+
+def changes_updates(method):
+    """ Bumps ``updates_generation`` once the session of the wrapped
+    method has been committed.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.updates_generation += 1
+        return result
+    return wrapper
 
 
 class DatabaseManager(object):
+    def __init__(self):
+        # Bumped whenever the updates table changes, so callers can drop
+        # anything they derived from it.
+        self.updates_generation = 0
+
     def initialize(self):
+        if DB.provider is not None:
+            # Already initialized by another manager of this process.
+            return
+
         DB.bind(provider='sqlite',
                 filename=hpxqt_utils.get_db_file_path(),
                 create_db=not os.path.exists(hpxqt_utils.get_db_file_path()))
 
+        self._add_missing_columns()
         DB.generate_mapping(create_tables=True)
 
+    @pony_orm.db_session
+    def _add_missing_columns(self):
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row[1] for row in DB.execute('PRAGMA table_info(%s)' % table)}
+            if not existing:
+                # The table is created with every column by pony.
+                continue
+
+            for name, definition in columns:
+                if name not in existing:
+                    DB.execute('ALTER TABLE %s ADD COLUMN %s %s' % (table, name, definition))
+
     @pony_orm.db_session
     def add_user(self, email, password):
         if self.get_user(email):
             return
         User(email=email, password=password)
 
+    @changes_updates
     @pony_orm.db_session
-    def add_update(self, version, url, platform, added=None, installed=False):
+    def add_update(self, version, url, platform, added=None, installed=False,
+                   sha256=None, delta_url=None, delta_sha256=None):
         data = dict(
             version=version, 
             url=url, 
             platform=platform, 
-            is_installed=installed)
+            is_installed=installed,
+            sha256=sha256 or '',
+            delta_url=delta_url or '',
+            delta_sha256=delta_sha256 or '')
         
         if added is not None:
             data['date'] = added
         u = Upgrade(**data)
         return u
 
+    @changes_updates
     @pony_orm.db_session
     def set_last_update_installed(self):
         update = pony_orm.select(u for u in Upgrade if not u.is_installed)\
@@ -57,9 +116,13 @@ class DatabaseManager(object):
         update.is_installed = True
 
     @pony_orm.db_session
-    def delete_user(self):
-        pony_orm.delete(u for u in User)
+    def delete_user(self, email=None):
+        if email is None:
+            pony_orm.delete(u for u in User)
+        else:
+            pony_orm.delete(u for u in User if u.email == email)
 
+    @changes_updates
     @pony_orm.db_session
     def delete_update(self, version):
         pony_orm.delete(u for u in Upgrade if u.version == version)
@@ -72,6 +135,10 @@ class DatabaseManager(object):
     def last_user(self):
         return pony_orm.select(u for u in User).order_by(User.id).first()
 
+    @pony_orm.db_session
+    def users(self):
+        return pony_orm.select(u for u in User).order_by(User.id)[:]
+
     @pony_orm.db_session
     def get_user(self, email):
         return pony_orm.select(u for u in User if u.email == email).first()
@@ -85,11 +152,20 @@ class DatabaseManager(object):
         u = self.get_update(version)
         u.is_downloaded = True
 
+    @pony_orm.db_session
+    def set_download_progress(self, version, download_path, downloaded_bytes):
+        u = self.get_update(version)
+        u.download_path = download_path or ''
+        u.downloaded_bytes = downloaded_bytes
+
     @pony_orm.db_session
     def remove_downloaded(self, version):
         u = self.get_update(version)
         u.is_downloaded = False
+        u.download_path = ''
+        u.downloaded_bytes = 0
         
+    @changes_updates
     @pony_orm.db_session
     def mark_installed(self, version):
         u = self.get_update(version)
@@ -0,0 +1,86 @@
+""" Binary patches between two builds of an update artifact.
+
+A patch starts with ``PATCH_MAGIC`` followed by an xz stream of
+operations building the new artifact from the old one:
+
+* ``b'C'`` + ``<QQ`` offset and length: copy bytes of the old artifact.
+* ``b'I'`` + ``<Q`` length + data: insert bytes carried by the patch.
+* ``b'E'``: end of the patch.
+"""
+import hashlib
+import lzma
+import os
+import struct
+
+from hpxqt import consts as hpxqt_consts
+
+
+PATCH_MAGIC = b'HPXDELTA1\n'
+
+_COPY = struct.Struct('<QQ')
+_INSERT = struct.Struct('<Q')
+
+
+class DeltaError(Exception):
+    pass
+
+
+def _read_exactly(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise DeltaError('Truncated patch')
+    return data
+
+
+def _write_copy(base, base_size, out, digest, offset, length):
+    if offset + length > base_size:
+        raise DeltaError('Patch copies past the end of the base file')
+
+    base.seek(offset)
+    while length:
+        data = base.read(min(length, hpxqt_consts.DOWNLOAD_CHUNK_MAX))
+        out.write(data)
+        digest.update(data)
+        length -= len(data)
+
+
+def _write_insert(patch, out, digest, length):
+    while length:
+        data = _read_exactly(patch, min(length, hpxqt_consts.DOWNLOAD_CHUNK_MAX))
+        out.write(data)
+        digest.update(data)
+        length -= len(data)
+
+
+def apply_patch(base_path, patch_path, out_path):
+    """ Writes the artifact built by the patch at ``patch_path`` from
+    ``base_path`` to ``out_path`` and returns its SHA-256 hex digest.
+    Memory use does not depend on the size of either file.
+    """
+    digest = hashlib.sha256()
+    base_size = os.path.getsize(base_path)
+
+    with open(patch_path, 'rb') as raw_patch:
+        if raw_patch.read(len(PATCH_MAGIC)) != PATCH_MAGIC:
+            raise DeltaError('Not a patch file')
+
+        try:
+            with lzma.open(raw_patch) as patch, \
+                    open(base_path, 'rb') as base, \
+                    open(out_path, 'wb') as out:
+                while True:
+                    op = _read_exactly(patch, 1)
+                    if op == b'C':
+                        offset, length = _COPY.unpack(_read_exactly(patch, _COPY.size))
+                        _write_copy(base, base_size, out, digest, offset, length)
+                    elif op == b'I':
+                        length, = _INSERT.unpack(_read_exactly(patch, _INSERT.size))
+                        _write_insert(patch, out, digest, length)
+                    elif op == b'E':
+                        break
+                    else:
+                        raise DeltaError('Unknown patch operation %r' % op)
+        except (lzma.LZMAError, EOFError) as e:
+            raise DeltaError('Corrupt patch: %s' % e)
+
+    return digest.hexdigest()
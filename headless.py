@@ -0,0 +1,151 @@
+""" Runs the manager without Qt, logging what the tray would show.
+
+    python -m hpxqt.headless [--email EMAIL --password PASSWORD]
+
+The credentials of the last desktop login are used by default.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+
+from hpxclient import daemon as hpxclient_daemon
+from hpxclient import settings
+from hpxqt import consts as hpxqt_consts
+from hpxqt import consumers as hpxqt_consumers
+from hpxqt import db as hpxqt_db
+from hpxqt import history as hpxqt_history
+from hpxqt import metrics as hpxqt_metrics
+from hpxqt import mng as hpxqt_mng
+
+
+logger = logging.getLogger('hpxqt')
+
+
+class HeadlessManager(object):
+    """ Counterpart of ``chainprox.ChainproxManager`` without Qt.
+    """
+
+    account = None
+
+    def __init__(self):
+        self.db_manager = hpxqt_db.DatabaseManager()
+        self.db_manager.initialize()
+        self.clients = hpxqt_mng.ClientManager()
+        self.history_path = hpxqt_history.get_history_file_path()
+
+        self._login = None
+        self._password = None
+
+    async def start_manager(self, login, password):
+        self._login = login
+        self._password = password
+
+        await self.clients.start(login, password,
+                                 message_handler=hpxqt_consumers.process_message,
+                                 proxy_enabled=settings.PROXY_SSL_ENABLED)
+
+    def stop_manager(self):
+        return self.clients.stop()
+
+    def save_credentials(self):
+        self.db_manager.add_user(email=self._login, password=self._password)
+
+    def delete_credentials(self):
+        self.db_manager.delete_user()
+
+
+class AuthResponseLogConsumer(hpxqt_consumers.AuthResponseConsumer):
+    async def process(self, error):
+        if error:
+            logger.error('Authentication failed: %s', error)
+            await self.mng.stop_manager()
+        else:
+            await self.run_in_executor(self.mng.save_credentials)
+            logger.info('Authenticated as %s', self.mng._login)
+
+
+class InfoBalanceLogConsumer(hpxqt_consumers.InfoBalanceConsumer):
+    MAX_RATE = hpxqt_consts.HEADLESS_LOG_RATE
+
+    def apply(self, balance_amount):
+        logger.info('Balance: %s', balance_amount)
+
+
+class PongLogConsumer(hpxqt_consumers.PongConsumer):
+    MAX_RATE = hpxqt_consts.HEADLESS_LOG_RATE
+
+    def apply(self, stats):
+        logger.info('Latency: %d ms (p50 %d ms, p95 %d ms, p99 %d ms)',
+                    stats['last'] * 1000, stats['p50'] * 1000,
+                    stats['p95'] * 1000, stats['p99'] * 1000)
+
+
+class InfoVersionLogConsumer(hpxqt_consumers.InfoVersionConsumer):
+    _logged_version = None
+
+    def process(self, update_version):
+        if update_version != self._logged_version:
+            self._logged_version = update_version
+            logger.info('Version %s is available', update_version)
+
+
+async def dump_stats(manager):
+    file_logger = logging.getLogger('hpxqt.file')
+    while True:
+        await asyncio.sleep(hpxqt_consts.METRICS_DUMP_INTERVAL)
+        hpxqt_metrics.DISPATCH_METRICS.dump()
+        file_logger.info('Connections: %s', manager.clients.stats())
+        file_logger.info('TLS: %s', manager.clients.tls_stats())
+
+
+async def run(email=None, password=None):
+    manager = HeadlessManager()
+
+    if not email:
+        user = manager.db_manager.last_user()
+        if not user:
+            logger.error('No saved credentials, pass --email and --password.')
+            return False
+        email, password = user.email, user.password
+
+    for consumer_cls in (AuthResponseLogConsumer,
+                         InfoBalanceLogConsumer,
+                         PongLogConsumer,
+                         InfoVersionLogConsumer):
+        hpxqt_consumers.register_consumer(consumer_cls)
+    hpxqt_consumers.bind_consumers(None, None, manager)
+
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, manager.stop_manager)
+        except NotImplementedError:  # windows
+            pass
+
+    stats_task = asyncio.ensure_future(dump_stats(manager))
+    try:
+        await manager.start_manager(email, password)
+    finally:
+        stats_task.cancel()
+        hpxqt_consumers.close_consumers()
+        hpxqt_metrics.DISPATCH_METRICS.dump()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run chainprox without a GUI.')
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    args = parser.parse_args()
+
+    if bool(args.email) != bool(args.password):
+        parser.error('--email and --password go together')
+
+    hpxclient_daemon.load_config()
+    return 0 if asyncio.run(run(args.email, args.password)) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import array
+import os
+import re
+import struct
+import threading
+import time
+
+from hpxqt import utils as hpxqt_utils
+
+
+def get_history_file_path(account=None):
+    """ Returns the balance history file of ``account``, None being the
+    account logged in through the window.
+    """
+    file_name = 'balance_history.bin'
+    if account is not None:
+        file_name = 'balance_history-%s.bin' % re.sub(r'[^\w.@-]', '_', account)
+    return os.path.join(hpxqt_utils.get_chainprox_dir_path(), file_name)
+
+
+class SampleRing(object):
+    """ Fixed-size ring of ``(timestamp, value)`` samples kept in two
+    arrays of doubles. Timestamps are expected to be non-decreasing.
+    """
+    _HEADER = struct.Struct('<III')
+
+    def __init__(self, size):
+        self.size = size
+        self.timestamps = array.array('d', bytes(8 * size))
+        self.values = array.array('d', bytes(8 * size))
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _position(self, index):
+        """ Position in the arrays of the ``index``-th oldest sample.
+        """
+        return (self._next - self._count + index) % self.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+
+        position = self._position(index)
+        return self.timestamps[position], self.values[position]
+
+    def append(self, timestamp, value):
+        self.timestamps[self._next] = timestamp
+        self.values[self._next] = value
+        self._next = (self._next + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def last_timestamp(self):
+        if not self._count:
+            return None
+        return self.timestamps[(self._next - 1) % self.size]
+
+    def replace_last(self, timestamp, value):
+        position = (self._next - 1) % self.size
+        self.timestamps[position] = timestamp
+        self.values[position] = value
+
+    def index_since(self, timestamp):
+        """ Index of the oldest sample taken at or after ``timestamp``.
+        """
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamps[self._position(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def to_bytes(self):
+        return (self._HEADER.pack(self.size, self._next, self._count)
+                + self.timestamps.tobytes() + self.values.tobytes())
+
+    def load_bytes(self, data, offset=0):
+        """ Restores the ring from ``to_bytes`` output found at ``offset``
+        of ``data`` and returns the offset past it.
+        """
+        size, _next, count = self._HEADER.unpack_from(data, offset)
+        if size != self.size:
+            raise ValueError('Ring size mismatch %d != %d' % (size, self.size))
+
+        offset += self._HEADER.size
+        length = 8 * size
+        if len(data) < offset + 2 * length:
+            raise ValueError('Truncated ring data')
+        self.timestamps = array.array('d', data[offset:offset + length])
+        self.values = array.array('d', data[offset + length:offset + 2 * length])
+        self._next, self._count = _next, count
+        return offset + 2 * length
+
+
+class BalanceHistory(object):
+    """ Constant-memory history of the account balance.
+
+    The newest samples are kept as they are, older ones survive in
+    per-minute, per-hour and per-day rollups holding the last balance
+    seen in each period. Rollups are updated on every insert. Without
+    a ``path`` the history is only kept in memory.
+    """
+    RAW_SIZE = 4096
+
+    # (period in seconds, number of periods kept)
+    ROLLUPS = (
+        (60, 24 * 60),
+        (60 * 60, 60 * 24),
+        (24 * 60 * 60, 10 * 366),
+    )
+
+    _MAGIC = b'HPXBH1'
+
+    def __init__(self, path=None):
+        self.path = path
+
+        self._lock = threading.Lock()
+        # Saves run on the pipeline worker and on shutdown, they share
+        # the temporary file.
+        self._save_lock = threading.Lock()
+        self.raw = SampleRing(self.RAW_SIZE)
+        self.rollups = [(period, SampleRing(size))
+                        for period, size in self.ROLLUPS]
+
+    def add(self, balance, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._lock:
+            self.raw.append(timestamp, balance)
+            for period, ring in self.rollups:
+                last_timestamp = ring.last_timestamp()
+                if last_timestamp is not None and last_timestamp // period == timestamp // period:
+                    ring.replace_last(timestamp, balance)
+                else:
+                    ring.append(timestamp, balance)
+
+    def latest(self):
+        with self._lock:
+            return self.raw[-1] if self.raw else None
+
+    def earnings_rate(self, window, now=None):
+        """ Returns the average balance change per second over the last
+        ``window`` seconds or None without two samples in the window.
+        The finest resolution still covering the window is used.
+        """
+        if now is None:
+            now = time.time()
+        since = now - window
+
+        with self._lock:
+            if not self.raw:
+                return None
+
+            rings = [self.raw] + [ring for period, ring in self.rollups]
+            covering = [ring for ring in rings if ring and ring[0][0] <= since]
+            # Without a covering ring use the one reaching furthest back.
+            ring = covering[0] if covering else min(rings, key=lambda r: r[0][0])
+
+            index = ring.index_since(since)
+            if index >= len(ring):
+                return None
+
+            first_ts, first_balance = ring[index]
+            last_ts, last_balance = self.raw[-1]
+
+        if last_ts <= first_ts:
+            return None
+        return (last_balance - first_balance) / (last_ts - first_ts)
+
+    def save(self):
+        """ Writes the history to ``path``, replacing the file atomically.
+        """
+        if self.path is None:
+            return
+
+        with self._save_lock:
+            with self._lock:
+                data = b''.join([self._MAGIC, self.raw.to_bytes()]
+                                + [ring.to_bytes() for period, ring in self.rollups])
+
+            tmp_path = '%s.tmp' % self.path
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+
+    def load(self):
+        """ Loads the history saved at ``path``. Returns False when there
+        is no usable file.
+        """
+        if self.path is None:
+            return False
+
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+
+        if not data.startswith(self._MAGIC):
+            return False
+
+        raw = SampleRing(self.RAW_SIZE)
+        rollups = [(period, SampleRing(size)) for period, size in self.ROLLUPS]
+        try:
+            offset = raw.load_bytes(data, len(self._MAGIC))
+            for period, ring in rollups:
+                offset = ring.load_bytes(data, offset)
+        except (ValueError, struct.error):
+            return False
+
+        with self._lock:
+            self.raw, self.rollups = raw, rollups
+        return True
@@ -0,0 +1,144 @@
+import array
+import bisect
+import collections
+import logging
+import threading
+
+
+# Upper bounds of the latency histogram buckets in seconds. The last
+# bucket of every histogram collects everything slower.
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+class LatencyHistogram(object):
+    """ Fixed-bucket latency histogram.
+    """
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def as_dict(self):
+        return dict(
+            count=self.count,
+            mean=self.total / self.count if self.count else 0.0,
+            max=self.max,
+            buckets=list(self.buckets),
+        )
+
+
+class RollingWindow(object):
+    """ The latest ``size`` samples kept in an array ring buffer. A sorted
+    copy is updated on every insert, so percentiles are a single lookup.
+    Not thread-safe.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._ring = array.array('d', bytes(8 * size))
+        self._sorted = array.array('d')
+        self._next = 0
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def add(self, value):
+        if len(self._sorted) == self.size:
+            evicted = self._ring[self._next]
+            del self._sorted[bisect.bisect_left(self._sorted, evicted)]
+
+        self._ring[self._next] = value
+        self._next = (self._next + 1) % self.size
+        bisect.insort(self._sorted, value)
+
+    def last(self):
+        if not self._sorted:
+            return None
+        return self._ring[self._next - 1]
+
+    def percentile(self, q):
+        """ Returns the nearest-rank ``q`` percentile, 0 <= q <= 100.
+        """
+        if not self._sorted:
+            return None
+        return self._sorted[round(q / 100 * (len(self._sorted) - 1))]
+
+
+class DispatchMetrics(object):
+    """ Per-kind message counters and consumer latency histograms.
+    Updated from the pipeline worker and the GUI thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.unknown = collections.Counter()
+        self.latencies = collections.defaultdict(LatencyHistogram)
+
+    def record(self, kind):
+        with self._lock:
+            self.counts[kind] += 1
+
+    def record_unknown(self, kind):
+        """ Counts a message of unregistered ``kind``. Returns True the
+        first time the kind is seen.
+        """
+        with self._lock:
+            self.unknown[kind] += 1
+            return self.unknown[kind] == 1
+
+    def observe(self, kind, stage, elapsed):
+        """ Adds ``elapsed`` seconds spent in ``stage`` of a consumer.
+        """
+        with self._lock:
+            self.latencies[(kind, stage)].add(elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(
+                counts=dict(self.counts),
+                unknown={_kind_str(kind): count
+                         for kind, count in self.unknown.items()},
+                latencies={'%s.%s' % key: histogram.as_dict()
+                           for key, histogram in self.latencies.items()},
+            )
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.unknown.clear()
+            self.latencies.clear()
+
+    def dump(self, logger=None):
+        """ Writes the current metrics to the ``hpxqt.file`` logger.
+        """
+        logger = logger or logging.getLogger('hpxqt.file')
+        snapshot = self.snapshot()
+
+        logger.info('Dispatch counts: %s', snapshot['counts'])
+        if snapshot['unknown']:
+            logger.info('Unknown kinds: %s', snapshot['unknown'])
+
+        bounds = ', '.join('<=%gms' % (b * 1000) for b in LATENCY_BUCKETS)
+        logger.info('Latency buckets: %s, slower', bounds)
+        for key, histogram in sorted(snapshot['latencies'].items()):
+            logger.info('%s: count=%d mean=%.3fms max=%.3fms buckets=%s',
+                        key, histogram['count'], histogram['mean'] * 1000,
+                        histogram['max'] * 1000, histogram['buckets'])
+
+
+def _kind_str(kind):
+    return kind.decode('ascii', 'replace') if isinstance(kind, bytes) else kind
+
+
+DISPATCH_METRICS = DispatchMetrics()
@@ -1,26 +1,200 @@
 import asyncio
+import functools
+import logging
+import random
+import time
 
 from hpxclient.mng import service as mng_service
-from hpxqt import consumers as hpxqt_consumers
+from hpxclient.fetcher.central import consumers as fetcher_central_consumers
 from hpxclient.fetcher.central import service as fetcher_central_service
+from hpxqt import consts as hpxqt_consts
+from hpxqt import tls as hpxqt_tls
 
 
-async def start_manager(email, password, proxy_enabled=False):
-    await asyncio.gather(
-        mng_service.start_client(
+logger = logging.getLogger('hpxqt')
+
+
+_AUTH_RESPONSE_KIND = fetcher_central_consumers.AuthResponseConsumer.KIND.encode()
+
+
+class ClientSupervisor(object):
+    """ Keeps one hpxclient service running. Whenever the client returns
+    or fails it is started again after a jittered exponential backoff.
+    The client only counts as connected once ``connected`` is called.
+    """
+
+    def __init__(self, name, start_client):
+        self.name = name
+        self._start_client = start_client
+
+        self.failures = 0
+        self.reconnects = 0
+        self.total_uptime = 0.0
+        self.last_reconnect_time = None
+
+        self._started_at = None
+        self._connected_at = None
+        self._disconnected_at = None
+        self._retry_at = None
+
+    def connected(self):
+        """ Marks the running client as connected, on the first message
+        it passed on for instance.
+        """
+        if self._connected_at is not None:
+            return
+
+        self._connected_at = time.monotonic()
+        if self._disconnected_at is not None:
+            self.reconnects += 1
+            self.last_reconnect_time = self._connected_at - self._disconnected_at
+            self._disconnected_at = None
+
+    async def run(self):
+        delay = hpxqt_consts.RECONNECT_BACKOFF_MIN
+        while True:
+            self._started_at = time.monotonic()
+            self._retry_at = None
+
+            try:
+                await self._start_client()
+            except asyncio.CancelledError:
+                self._stopped()
+                raise
+            except Exception:
+                self.failures += 1
+                logger.warning('%s client failed', self.name, exc_info=True)
+
+            uptime = self._stopped()
+
+            # A connection which held for a while starts the backoff over.
+            if uptime >= hpxqt_consts.RECONNECT_BACKOFF_RESET:
+                delay = hpxqt_consts.RECONNECT_BACKOFF_MIN
+
+            backoff = delay / 2 + random.uniform(0, delay / 2)
+            delay = min(delay * 2, hpxqt_consts.RECONNECT_BACKOFF_MAX)
+
+            logger.info('%s client disconnected, reconnecting in %.1fs',
+                        self.name, backoff)
+            self._retry_at = time.monotonic() + backoff
+            await asyncio.sleep(backoff)
+
+    def _stopped(self):
+        """ Returns how long the client was connected.
+        """
+        now = time.monotonic()
+        uptime = 0.0
+        if self._connected_at is not None:
+            uptime = now - self._connected_at
+            self.total_uptime += uptime
+            # Time to reconnect counts from the loss of a connection,
+            # across the attempts which did not connect.
+            self._disconnected_at = now
+
+        self._started_at = self._connected_at = None
+        return uptime
+
+    def stats(self):
+        now = time.monotonic()
+        connected = self._connected_at is not None
+        uptime = now - self._connected_at if connected else 0.0
+        return dict(
+            name=self.name,
+            connected=connected,
+            connecting=self._started_at is not None and not connected,
+            uptime=uptime,
+            total_uptime=self.total_uptime + uptime,
+            failures=self.failures,
+            reconnects=self.reconnects,
+            last_reconnect_time=self.last_reconnect_time,
+            next_retry_in=max(self._retry_at - now, 0.0) if self._retry_at else None,
+        )
+
+
+class ClientManager(object):
+    """ Runs the hpxclient services of one login and keeps the handles
+    of their tasks, so they can be stopped and started again.
+    """
+
+    def __init__(self):
+        self._tasks = []
+        self.supervisors = []
+
+    async def start(self, email, password, message_handler, proxy_enabled=False):
+        """ Runs the supervised clients until they are stopped. Clients of
+        a previous login are stopped first.
+        """
+        started = time.monotonic()
+        restart = bool(self._tasks)
+        if restart:
+            await self.stop()
+
+        # Both clients share one context, so they share its TLS sessions.
+        ssl_context = hpxqt_tls.get_ssl_context() if proxy_enabled else False
+
+        def connection_handler(msg):
+            mng_supervisor.connected()
+            # The fetcher client does not pass messages on, its login
+            # is answered through the mng client.
+            if (msg[b'kind'] == _AUTH_RESPONSE_KIND
+                    and not msg[b'data'].get(b'error')):
+                fetcher_supervisor.connected()
+            return message_handler(msg)
+
+        mng_supervisor = ClientSupervisor('mng', functools.partial(
+            mng_service.start_client,
             email=email,
             password=password,
-            message_handler=hpxqt_consumers.process_message,
-            ssl=proxy_enabled
-        ),
-
-        fetcher_central_service.start_client(
+            message_handler=connection_handler,
+            ssl=ssl_context
+        ))
+        fetcher_supervisor = ClientSupervisor('fetcher', functools.partial(
+            fetcher_central_service.start_client,
             email=email,
             password=password,
-            ssl=proxy_enabled
-        )
-    )
+            ssl=ssl_context
+        ))
+        self.supervisors = [mng_supervisor, fetcher_supervisor]
+        self._tasks = tasks = [asyncio.ensure_future(supervisor.run())
+                               for supervisor in self.supervisors]
+        if restart:
+            logger.info('Manager restarted in %.3fs', time.monotonic() - started)
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error('Manager client failed', exc_info=result)
+
+    def stats(self):
+        """ Connection health of every client.
+        """
+        return [supervisor.stats() for supervisor in self.supervisors]
+
+    @staticmethod
+    def tls_stats():
+        """ Handshake and session reuse counts of the shared TLS context.
+        """
+        return hpxqt_tls.get_ssl_context().stats()
+
+    def stop(self, timeout=hpxqt_consts.MANAGER_STOP_TIMEOUT):
+        """ Cancels the client tasks. Returns a future resolved with the
+        teardown time once they finished or ``timeout`` passed.
+        """
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        return asyncio.ensure_future(self._wait_stopped(tasks, timeout))
+
+    @staticmethod
+    async def _wait_stopped(tasks, timeout):
+        started = time.monotonic()
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            if pending:
+                logger.warning('%d manager client(s) did not stop in %ss',
+                               len(pending), timeout)
 
+        elapsed = time.monotonic() - started
+        logger.info('Manager stopped in %.3fs', elapsed)
+        return elapsed
 
-def stop_manager():
-    return
@@ -0,0 +1,47 @@
+import logging
+
+import aiohttp
+
+from hpxqt import consts as hpxqt_consts
+
+
+logger = logging.getLogger('hpxqt')
+
+
+# HTTP session of the application, bound to the event loop it was
+# created in.
+_SESSION = None
+
+
+def get_session():
+    """ Returns the HTTP session shared by the application. Its pooled
+    connections are kept alive between requests to the same host.
+    Must be called from a coroutine.
+    """
+    global _SESSION
+
+    if _SESSION is None or _SESSION.closed:
+        connector = aiohttp.TCPConnector(
+            limit=hpxqt_consts.HTTP_POOL_SIZE,
+            keepalive_timeout=hpxqt_consts.HTTP_KEEPALIVE_TIMEOUT)
+        timeout = aiohttp.ClientTimeout(
+            connect=hpxqt_consts.HTTP_CONNECT_TIMEOUT,
+            sock_read=hpxqt_consts.HTTP_READ_TIMEOUT)
+        _SESSION = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _SESSION
+
+
+async def close_session():
+    global _SESSION
+
+    session, _SESSION = _SESSION, None
+    if session is not None and not session.closed:
+        await session.close()
+
+
+async def post(url, data=None):
+    """ Posts form ``data`` to ``url`` and returns the response status.
+    """
+    async with get_session().post(url, data=data) as response:
+        await response.read()
+        return response.status
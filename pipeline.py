@@ -0,0 +1,217 @@
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import logging
+import threading
+import time
+
+from PyQt5 import QtCore
+
+from hpxqt import consts as hpxqt_consts
+from hpxqt import consumers as hpxqt_consumers
+from hpxqt import metrics as hpxqt_metrics
+
+
+logger = logging.getLogger('hpxqt')
+
+
+class MessageQueue(object):
+    """ Thread-safe FIFO of ``(consumer, item)`` pairs holding about
+    ``maxsize`` entries. What happens to a new entry depends on the
+    ``QUEUE_POLICY`` of its consumer:
+
+    * ``QUEUE_KEEP`` entries are always queued.
+    * ``QUEUE_LATEST`` entries replace the pending entry of the same
+      consumer, so there is at most one of them per kind.
+    * ``QUEUE_DROP`` entries are dropped while the queue is full.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.dropped = collections.Counter()
+        self.merged = collections.Counter()
+
+        self._lock = threading.Lock()
+        self._entries = collections.deque()
+        self._latest = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, consumer, item):
+        """ Returns False if the entry was dropped.
+        """
+        policy = consumer.QUEUE_POLICY
+
+        with self._lock:
+            if policy == hpxqt_consts.QUEUE_LATEST:
+                entry = self._latest.get(consumer)
+                if entry is not None:
+                    entry[1] = item
+                    self.merged[consumer.KIND] += 1
+                    return True
+
+            elif (policy == hpxqt_consts.QUEUE_DROP
+                  and len(self._entries) >= self.maxsize):
+                self.dropped[consumer.KIND] += 1
+                return False
+
+            entry = [consumer, item]
+            self._entries.append(entry)
+            if policy == hpxqt_consts.QUEUE_LATEST:
+                self._latest[consumer] = entry
+            return True
+
+    def pop_all(self):
+        """ Removes and returns every queued entry in order.
+        """
+        with self._lock:
+            entries, self._entries = self._entries, collections.deque()
+            self._latest.clear()
+        return entries
+
+    def stats(self):
+        with self._lock:
+            return dict(depth=len(self._entries),
+                        dropped=dict(self.dropped),
+                        merged=dict(self.merged))
+
+
+class MessagePipeline(QtCore.QObject):
+    """ Parses and normalizes manager messages on a worker thread.
+    Only the final ``Consumer.process`` calls are posted back to the GUI
+    thread, where ``signal_messages_ready`` makes them run.
+
+    Both hops go through a bounded ``MessageQueue``, so a stalled worker
+    or GUI thread does not make the pending messages grow without limit.
+    """
+    signal_messages_ready = QtCore.pyqtSignal()
+
+    def __init__(self, metrics=None):
+        super().__init__()
+
+        self.metrics = metrics or hpxqt_metrics.DISPATCH_METRICS
+
+        # Raw messages waiting for the worker and prepared payloads
+        # waiting for the GUI thread.
+        self.inbox = MessageQueue(hpxqt_consts.MESSAGE_QUEUE_SIZE)
+        self.outbox = MessageQueue(hpxqt_consts.MESSAGE_QUEUE_SIZE)
+
+        # A single worker keeps the messages in arrival order.
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='hpxqt-pipeline')
+        self._drain_lock = threading.Lock()
+        self._drain_scheduled = False
+        self._delivery_scheduled = False
+
+        # The signal is emitted from the worker thread, so Qt queues
+        # the call into the thread this object lives in.
+        self.signal_messages_ready.connect(self.deliver_ready)
+
+        self._metrics_timer = QtCore.QTimer(self)
+        self._metrics_timer.timeout.connect(self.dump_stats)
+        self._metrics_timer.start(hpxqt_consts.METRICS_DUMP_INTERVAL * 1000)
+
+    def submit(self, msg, consumers=None):
+        """ Message handler passed to the hpxclient services. Messages of
+        an account other than the default one carry its ``ConsumerTable``.
+        """
+        kind = msg[b'kind']
+        if consumers is not None:
+            consumer = consumers.get(kind)
+        else:
+            consumer = hpxqt_consumers.get_consumer(kind)
+        if consumer is None:
+            if self.metrics.record_unknown(kind):
+                logger.warning('Kind not recognized %s', kind.decode())
+            return
+
+        self.metrics.record(consumer.KIND)
+        try:
+            consumer.receive(msg[b'data'])
+        except Exception:
+            logger.exception('Failed to receive %s message', consumer.KIND)
+            return
+        if not self.inbox.put(consumer, msg[b'data']):
+            return
+
+        with self._drain_lock:
+            if self._drain_scheduled:
+                return
+            self._drain_scheduled = True
+        self._executor.submit(self._drain_inbox)
+
+    def barrier(self):
+        """ Returns a future resolved once every message submitted so far
+        has been prepared.
+        """
+        return self._executor.submit(lambda: None)
+
+    def queue_stats(self):
+        return dict(inbox=self.inbox.stats(), outbox=self.outbox.stats())
+
+    def dump_stats(self):
+        self.metrics.dump()
+        logging.getLogger('hpxqt.file').info('Message queues: %s',
+                                             self.queue_stats())
+
+    def shutdown(self):
+        self._metrics_timer.stop()
+        self._executor.shutdown(wait=False)
+        self.dump_stats()
+
+    def _drain_inbox(self):
+        while True:
+            with self._drain_lock:
+                entries = self.inbox.pop_all()
+                if not entries:
+                    self._drain_scheduled = False
+                    return
+
+            for consumer, data in entries:
+                self._prepare(consumer, data)
+
+    def _prepare(self, consumer, data):
+        started = time.perf_counter()
+        try:
+            payload = consumer.prepare(data)
+        except Exception:
+            logger.exception('Failed to prepare %s message', consumer.KIND)
+            return
+        finally:
+            self.metrics.observe(consumer.KIND, 'prepare',
+                                 time.perf_counter() - started)
+
+        if payload is None or not self.outbox.put(consumer, payload):
+            return
+
+        if not self._delivery_scheduled:
+            self._delivery_scheduled = True
+            self.signal_messages_ready.emit()
+
+    @QtCore.pyqtSlot()
+    def deliver_ready(self):
+        # Cleared before draining, so a payload queued meanwhile
+        # schedules another delivery.
+        self._delivery_scheduled = False
+        for consumer, payload in self.outbox.pop_all():
+            self.deliver(consumer, payload)
+
+    def deliver(self, consumer, payload):
+        started = time.perf_counter()
+        try:
+            task = consumer.dispatch(payload)
+        except Exception:
+            logger.exception('Failed to process %s message', consumer.KIND)
+            return
+        finally:
+            self.metrics.observe(consumer.KIND, 'process',
+                                 time.perf_counter() - started)
+
+        if isinstance(task, asyncio.Future):
+            task.add_done_callback(functools.partial(
+                self._observe_task, consumer.KIND, started))
+
+    def _observe_task(self, kind, started, task):
+        self.metrics.observe(kind, 'task', time.perf_counter() - started)
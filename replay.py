@@ -0,0 +1,274 @@
+""" Records the messages passed to the consumers and replays them
+without a server.
+
+    python -m hpxqt.replay messages.rec [--realtime]
+
+Messages are recorded when the ``HPXQT_RECORD_FILE`` environment
+variable points to a file. Messages of additional accounts are replayed
+into consumers of their own account.
+"""
+import argparse
+import asyncio
+import marshal
+import os
+import struct
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+import qasync
+from PyQt5 import QtWidgets
+
+from hpxqt import consumers as hpxqt_consumers
+from hpxqt import metrics as hpxqt_metrics
+from hpxqt import pipeline as hpxqt_pipeline
+
+RECORD_FILE_ENV = 'HPXQT_RECORD_FILE'
+
+# Every record is a timestamp and the length of the marshalled
+# ``(account, msg)`` pair.
+_HEADER = struct.Struct('<dI')
+
+
+class MessageRecorder(object):
+    """ Appends every message passed through ``wrap`` handlers to
+    ``path``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'ab')
+
+    def record(self, msg, account=None):
+        blob = marshal.dumps((account, msg))
+        self._file.write(_HEADER.pack(time.time(), len(blob)))
+        self._file.write(blob)
+        self._file.flush()
+
+    def wrap(self, message_handler, account=None):
+        def handler(msg):
+            self.record(msg, account=account)
+            return message_handler(msg)
+        return handler
+
+    def close(self):
+        self._file.close()
+
+
+# Recorder shared by the managers of all accounts.
+_RECORDER = None
+
+
+def get_recorder():
+    """ Returns the recorder of the process, None if messages are not
+    recorded.
+    """
+    global _RECORDER
+
+    if _RECORDER is None:
+        record_file = os.environ.get(RECORD_FILE_ENV)
+        if record_file:
+            _RECORDER = MessageRecorder(record_file)
+    return _RECORDER
+
+
+def close_recorder():
+    global _RECORDER
+
+    recorder, _RECORDER = _RECORDER, None
+    if recorder is not None:
+        recorder.close()
+
+
+def read_messages(path):
+    """ Yields ``(timestamp, account, msg)`` tuples of a recorded file.
+    A record truncated by a crash ends the iteration.
+    """
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+
+            timestamp, size = _HEADER.unpack(header)
+            blob = f.read(size)
+            if len(blob) < size:
+                return
+            record = marshal.loads(blob)
+            if isinstance(record, dict):
+                # Recorded before records carried the account.
+                record = None, record
+            account, msg = record
+            yield timestamp, account, msg
+
+
+async def replay(path, message_handler, realtime=False,
+                 account_consumers=None):
+    """ Feeds the recorded messages to ``message_handler``, keeping the
+    original spacing if ``realtime`` is set. Messages of an additional
+    account are passed with the ``ConsumerTable`` returned for it by
+    ``account_consumers``. Returns the message count.
+    """
+    count = 0
+    first_ts = started = None
+
+    for timestamp, account, msg in read_messages(path):
+        if realtime:
+            if first_ts is None:
+                first_ts, started = timestamp, time.monotonic()
+            delay = (timestamp - first_ts) - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        if account is None or account_consumers is None:
+            message_handler(msg)
+        else:
+            message_handler(msg, consumers=account_consumers(account))
+        count += 1
+    return count
+
+
+class _Signal(object):
+    def emit(self, *args):
+        pass
+
+
+class _Widget(object):
+    def setDisabled(self, is_disabled):
+        pass
+
+
+class StubUpdate(object):
+    def __init__(self, version):
+        self.version = version
+        self.is_installed = False
+
+
+class StubDatabaseManager(object):
+    """ In-memory stand-in for the update queries of ``DatabaseManager``.
+    """
+
+    def __init__(self):
+        self.updates = {}
+        self.updates_generation = 0
+
+    def get_update(self, version):
+        return self.updates.get(version)
+
+    def add_update(self, version, url, platform, added=None, installed=False,
+                   sha256=None, delta_url=None, delta_sha256=None):
+        update = self.updates[version] = StubUpdate(version)
+        update.is_installed = installed
+        self.updates_generation += 1
+        return update
+
+
+class StubWindow(object):
+    def __init__(self):
+        self.upgrade = _Widget()
+        self.signal_minimize_tray = _Signal()
+
+    def show(self):
+        pass
+
+    def show_error(self, error_msg):
+        pass
+
+
+class StubManager(object):
+    def __init__(self, db_manager, account=None):
+        self.db_manager = db_manager
+        self.account = account
+        # Replayed balances must not end up in the real history.
+        self.history_path = None
+
+    def stop_manager(self):
+        future = asyncio.get_event_loop().create_future()
+        future.set_result(0.0)
+        return future
+
+    def save_credentials(self):
+        pass
+
+    def delete_credentials(self):
+        pass
+
+
+class StubTray(object):
+    """ Tray with real menu widgets, so label updates cost what they
+    cost in the application.
+    """
+
+    def __init__(self):
+        self.trayIconMenu = QtWidgets.QMenu()
+        self.label_balance = QtWidgets.QAction('Balance: unknown', None)
+        self.trayIconMenu.addAction(self.label_balance)
+        self.label_latency = QtWidgets.QAction('Latency: unknown', None)
+        self.trayIconMenu.addAction(self.label_latency)
+
+    def set_balance(self, balance_amount, account=None):
+        self.label_balance.setText("Balance: %s" % balance_amount)
+
+
+def _max_rss():
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def run_replay(path, realtime=False):
+    db_manager = StubDatabaseManager()
+    window, tray = StubWindow(), StubTray()
+    hpxqt_consumers.bind_consumers(window, tray, StubManager(db_manager))
+
+    tables = {}
+
+    def account_consumers(account):
+        table = tables.get(account)
+        if table is None:
+            table = tables[account] = hpxqt_consumers.ConsumerTable(
+                window, tray, StubManager(db_manager, account=account))
+        return table
+
+    metrics = hpxqt_metrics.DispatchMetrics()
+    pipeline = hpxqt_pipeline.MessagePipeline(metrics=metrics)
+
+    rss_before = _max_rss()
+    started = time.perf_counter()
+
+    count = await replay(path, pipeline.submit, realtime=realtime,
+                         account_consumers=account_consumers)
+    await asyncio.wrap_future(pipeline.barrier())
+    QtWidgets.QApplication.processEvents()
+
+    elapsed = time.perf_counter() - started
+    rss_after = _max_rss()
+    gui_time = sum(histogram.total
+                   for (kind, stage), histogram in metrics.latencies.items()
+                   if stage == 'process')
+
+    print('Messages: %d in %.3fs (%.0f msg/s)' % (count, elapsed, count / elapsed if elapsed else 0))
+    print('GUI thread occupancy: %.1f%%' % (100 * gui_time / elapsed if elapsed else 0))
+    print('Max RSS growth: %d KB' % (rss_after - rss_before))
+    print('Counts: %s' % metrics.snapshot()['counts'])
+
+    pipeline.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded messages.')
+    parser.add_argument('path')
+    parser.add_argument('--realtime', action='store_true',
+                        help='keep the original spacing between messages')
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    qasync.run(run_replay(args.path, realtime=args.realtime))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+""" Tests of ``upgrade.Downloader`` against a local HTTP server.
+"""
+import asyncio
+import hashlib
+import http.server
+import io
+import os
+import re
+import socket
+import tarfile
+import threading
+import types
+
+import pytest
+from PyQt5.QtCore import QObject
+
+from hpxqt import consts as hpxqt_consts
+from hpxqt import net as hpxqt_net
+from hpxqt import upgrade as hpxqt_upgrade
+from hpxqt.bench import extract as bench_extract
+
+
+DATA = bytes(range(256)) * 1200
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """ Serves ``data``, honouring ``Range`` headers if ``ranges`` is set.
+    With ``drop_after`` the connection is closed after that many bytes of
+    each body, once ``stall`` is set if it is given.
+    """
+    protocol_version = 'HTTP/1.1'
+    data = b''
+    ranges = True
+    drop_after = None
+    stall = None
+    requests = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        self.requests.append(range_header)
+
+        start, status = 0, 200
+        match = re.match(r'bytes=(\d+)-', range_header or '')
+        if match and self.ranges:
+            start, status = int(match.group(1)), 206
+
+        if start >= len(self.data) and status == 206:
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */%d' % len(self.data))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = self.data[start:]
+        self.send_response(status)
+        if status == 206:
+            self.send_header('Content-Range', 'bytes %d-%d/%d'
+                             % (start, len(self.data) - 1, len(self.data)))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if self.drop_after is not None and self.drop_after < len(body):
+            self.wfile.write(body[:self.drop_after])
+            self.wfile.flush()
+            if self.stall is not None:
+                self.stall.wait()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    handler = type('Handler', (_Handler,), {'data': DATA, 'requests': []})
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    handler.url = 'http://127.0.0.1:%d/update' % httpd.server_address[1]
+    yield handler
+
+    if handler.stall is not None:
+        handler.stall.set()
+    httpd.shutdown()
+    httpd.server_close()
+    thread.join()
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(hpxqt_consts, 'DOWNLOAD_RETRY_DELAY', 0)
+
+
+def download(url, path, offset=0, sha256=SHA256):
+    """ Runs a download, returns the failure or None and the offsets
+    passed to ``save_progress``.
+    """
+    saved = []
+    result = []
+
+    async def run():
+        downloader = hpxqt_upgrade.Downloader(url, str(path), offset=offset,
+                                              save_progress=saved.append,
+                                              sha256=sha256)
+        downloader.signal_download_finished.connect(lambda kind: result.append(None))
+        downloader.signal_download_failed.connect(result.append)
+        try:
+            await downloader.start()
+        finally:
+            await hpxqt_net.close_session()
+
+    asyncio.run(run())
+    assert len(result) == 1
+    return result[0], saved
+
+
+def test_download(server, tmp_path):
+    path = tmp_path / 'update'
+    error, saved = download(server.url, path)
+
+    assert error is None
+    assert path.read_bytes() == DATA
+    assert server.requests == ['bytes=0-']
+    assert saved[-1] == len(DATA)
+
+
+def test_resume_partial_download(server, tmp_path):
+    path = tmp_path / 'update'
+    offset = len(DATA) // 2
+    path.write_bytes(DATA[:offset])
+
+    error, saved = download(server.url, path, offset=offset)
+
+    assert error is None
+    assert path.read_bytes() == DATA
+    assert server.requests == ['bytes=%d-' % offset]
+    assert saved[-1] == len(DATA)
+
+
+def test_server_without_ranges(server, tmp_path):
+    server.ranges = False
+    path = tmp_path / 'update'
+    offset = len(DATA) // 2
+    path.write_bytes(b'x' * offset)
+
+    error, saved = download(server.url, path, offset=offset)
+
+    assert error is None
+    assert path.read_bytes() == DATA
+    assert server.requests == ['bytes=%d-' % offset]
+    assert saved[-1] == len(DATA)
+
+
+def test_complete_download(server, tmp_path):
+    path = tmp_path / 'update'
+    path.write_bytes(DATA)
+
+    error, saved = download(server.url, path, offset=len(DATA))
+
+    assert error is None
+    assert path.read_bytes() == DATA
+    assert server.requests == ['bytes=%d-' % len(DATA)]
+
+
+def test_checksum_mismatch(server, tmp_path):
+    path = tmp_path / 'update'
+    error, saved = download(server.url, path, sha256='0' * 64)
+
+    assert error.startswith('Checksum mismatch')
+    # The next attempt starts over.
+    assert saved[-1] == 0
+
+
+def test_connection_dropped_within_chunk(server, tmp_path):
+    server.drop_after = hpxqt_consts.DOWNLOAD_CHUNK_MIN // 2
+    path = tmp_path / 'update'
+
+    error, saved = download(server.url, path)
+
+    assert error is None
+    assert path.read_bytes() == DATA
+    # Every response carried on where the previous one dropped.
+    assert server.requests == ['bytes=%d-' % offset for offset
+                               in range(0, len(DATA), server.drop_after)]
+
+
+class _Window(hpxqt_upgrade.WindowUpdateMixIn, QObject):
+    """ The update mix-in without a window, downloading ``url``.
+    """
+
+    def __init__(self, url, download_dir):
+        QObject.__init__(self)
+        hpxqt_upgrade.WindowUpdateMixIn.__init__(self)
+
+        self.router = types.SimpleNamespace(db_manager=types.SimpleNamespace(
+            set_download_progress=lambda *args: None))
+        self.last_update = types.SimpleNamespace(
+            url=url, version='1', platform=hpxqt_consts.LINUX_OS, sha256=None,
+            download_path=None, downloaded_bytes=0)
+        self.download_dir = types.SimpleNamespace(name=str(download_dir))
+        self.download_file = os.path.join(str(download_dir), 'update.tar')
+
+
+@pytest.mark.parametrize('cancel_upgrade', [True, False])
+def test_cancelled_download_ends_extraction(server, tmp_path, cancel_upgrade):
+    archive = io.BytesIO()
+    bench_extract.make_archive(archive, [
+        ('chainprox', tarfile.REGTYPE, DATA * 4),
+    ])
+    server.data = archive.getvalue()
+    server.drop_after = hpxqt_consts.DOWNLOAD_CHUNK_MIN * 2
+    server.stall = threading.Event()
+
+    async def run():
+        window = _Window(server.url, tmp_path)
+        try:
+            window._start_full_download()
+            extraction, extraction_dir = window.extraction, window.extraction_dir
+            while not window.downloader.offset:
+                await asyncio.sleep(0.01)
+
+            if cancel_upgrade:
+                window.cancel_upgrade()
+            else:
+                window.downloader.cancel()
+
+            with pytest.raises(hpxqt_upgrade.DownloadError):
+                await asyncio.wait_for(extraction, 5)
+            while window.extraction is not None or os.path.exists(extraction_dir):
+                await asyncio.sleep(0.01)
+        finally:
+            await hpxqt_net.close_session()
+
+    asyncio.run(asyncio.wait_for(run(), 10))
@@ -0,0 +1,64 @@
+""" Tests of ``upgrade.extract_archive``.
+"""
+import io
+import os
+import tarfile
+
+import pytest
+
+from hpxqt import upgrade as hpxqt_upgrade
+from hpxqt.bench import extract as bench_extract
+
+
+def extract(entries, path):
+    archive = io.BytesIO()
+    bench_extract.make_archive(archive, entries)
+    archive.seek(0)
+    with tarfile.open(fileobj=archive, mode='r|*') as tar:
+        extracted_path = hpxqt_upgrade.extract_archive(tar, str(path))
+        assert tar.members == []
+    return extracted_path
+
+
+@pytest.mark.parametrize('case', sorted(bench_extract.unsafe_archives('/victim')))
+def test_unsafe_archive_is_refused(tmp_path, case):
+    victim = tmp_path / 'victim'
+    victim.write_bytes(b'victim')
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+
+    entries = bench_extract.unsafe_archives(str(victim))[case]
+    with pytest.raises(hpxqt_upgrade.ArchiveError):
+        extract(entries, dest)
+    assert victim.read_bytes() == b'victim'
+    assert sorted(os.listdir(tmp_path)) == ['dest', 'victim']
+
+
+def test_archive_with_links(tmp_path):
+    entries = [
+        ('chainprox', tarfile.DIRTYPE, None),
+        ('chainprox/lib', tarfile.DIRTYPE, None),
+        ('chainprox/lib/libx.so.1.0', tarfile.REGTYPE, b'lib'),
+        ('chainprox/lib/libx.so.1', tarfile.SYMTYPE, 'libx.so.1.0'),
+        ('chainprox/lib/libx.so', tarfile.SYMTYPE, 'libx.so.1'),
+        ('chainprox/libx.so', tarfile.SYMTYPE, 'lib/../lib/libx.so'),
+        ('chainprox/copy.so', tarfile.LNKTYPE, 'chainprox/lib/libx.so.1.0'),
+        ('chainprox/chainprox', tarfile.REGTYPE, b'app'),
+    ]
+    assert extract(entries, tmp_path) == str(tmp_path / 'chainprox')
+    assert (tmp_path / 'chainprox' / 'libx.so').read_bytes() == b'lib'
+    assert (tmp_path / 'chainprox' / 'copy.so').read_bytes() == b'lib'
+    assert (tmp_path / 'chainprox' / 'chainprox').read_bytes() == b'app'
+
+
+def test_flat_archive_returns_last_entry(tmp_path):
+    entries = [
+        ('libs/libx.so', tarfile.REGTYPE, b'lib'),
+        ('chainprox', tarfile.REGTYPE, b'app'),
+    ]
+    assert extract(entries, tmp_path) == str(tmp_path / 'chainprox')
+
+
+def test_empty_archive(tmp_path):
+    with pytest.raises(tarfile.ReadError):
+        extract([('.', tarfile.DIRTYPE, None)], tmp_path)
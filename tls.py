@@ -0,0 +1,76 @@
+import ssl
+
+
+class ResumingSSLObject(ssl.SSLObject):
+    """ ``SSLObject`` which offers the last session of its host when
+    connecting and keeps the newest session afterwards.
+    """
+    _has_ticket = False
+
+    def do_handshake(self):
+        super().do_handshake()
+
+        context = self.context
+        context.handshakes += 1
+        if self.session_reused:
+            context.resumed += 1
+        self._store_session()
+
+    def read(self, *args, **kwargs):
+        data = super().read(*args, **kwargs)
+        # TLS 1.3 tickets arrive after the handshake.
+        if not self._has_ticket:
+            self._store_session()
+        return data
+
+    def _store_session(self):
+        session = self.session
+        self._has_ticket = session is not None and session.has_ticket
+        if self._has_ticket:
+            self.context.sessions[self.server_hostname] = session
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """ Client context shared by the manager clients. TLS sessions are
+    cached per host, so reconnects resume them instead of running a
+    full handshake.
+    """
+    sslobject_class = ResumingSSLObject
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.sessions = {}
+        self.handshakes = 0
+        self.resumed = 0
+
+    def wrap_bio(self, incoming, outgoing, server_side=False,
+                 server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.sessions.get(server_hostname)
+
+        return super().wrap_bio(incoming, outgoing, server_side=server_side,
+                                server_hostname=server_hostname,
+                                session=session)
+
+    def stats(self):
+        return dict(
+            handshakes=self.handshakes,
+            resumed=self.resumed,
+            reuse_rate=self.resumed / self.handshakes if self.handshakes else 0.0,
+            cached_sessions=len(self.sessions),
+        )
+
+
+_SSL_CONTEXT = None
+
+
+def get_ssl_context():
+    """ Returns the client ``SSLContext`` shared by every connection of
+    the process.
+    """
+    global _SSL_CONTEXT
+
+    if _SSL_CONTEXT is None:
+        _SSL_CONTEXT = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        _SSL_CONTEXT.load_default_certs()
+    return _SSL_CONTEXT
@@ -1,38 +1,699 @@
+import asyncio
+import collections
+import functools
+import hashlib
+import io
+import logging
 import os
+import re
 import shutil
 import tarfile
 import tempfile
+import threading
+import time
 
-import requests
-from PyQt5.QtCore import QThread
+import aiohttp
+from PyQt5.QtCore import QObject
 from PyQt5.QtCore import pyqtSignal
 
+from hpxqt import __version__ as version
 from hpxqt import consts as hpxqt_consts
+from hpxqt import delta as hpxqt_delta
+from hpxqt import net as hpxqt_net
 from hpxqt import utils as hpxqt_utils
 
 
-class DownloadThread(QThread):
+logger = logging.getLogger('hpxqt')
+
+
+class DownloadError(Exception):
+    pass
+
+
+# Errors after which a download is retried.
+RETRY_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+
+class _Segment(object):
+    """ Byte range ``[start, end)`` of a segmented download, of which
+    everything before ``pos`` has been written.
+    """
+
+    def __init__(self, start, end, response=None):
+        self.start = start
+        self.end = end
+        self.pos = start
+        self.failures = 0
+
+        # Open response serving the segment, if there is one.
+        self.response = response
+
+
+class Downloader(QObject):
+    """ Downloads ``url`` to ``file_path`` on the event loop, using the
+    pooled connections of ``net.get_session``. A download interrupted
+    after ``offset`` bytes continues with a ``Range`` request, both after
+    a dropped connection and after a restart of the application.
+
+    Large downloads are split into byte ranges fetched over several
+    connections, see ``_write_segments``. The SHA-256 digest is compared
+    with ``sha256`` of the manifest, if it is given. File writes and
+    ``save_progress`` calls run in the default executor, so they do not
+    block the loop.
+
+    ``signal_download_progress`` is emitted at most
+    ``DOWNLOAD_PROGRESS_RATE`` times per second, see ``progress``.
+    ``on_written`` is called with the size of the part of the file
+    written without gaps whenever it changes.
+    """
     signal_download_finished = pyqtSignal(int)
+    signal_download_failed = pyqtSignal(str)
+    signal_download_progress = pyqtSignal(int, object)
 
-    def __init__(self, url, file_path):
-        QThread.__init__(self)
+    def __init__(self, url, file_path, offset=0, save_progress=None, sha256=None,
+                 on_written=None):
+        super().__init__()
         self.url = url
         self.file_path = file_path
+        self.offset = offset
+        self.save_progress = save_progress
+        self.on_written = on_written
+        self.sha256 = sha256.lower() if sha256 else None
+
+        self.total = None
+        self.chunk_size = hpxqt_consts.DOWNLOAD_CHUNK_MIN
+        self.connections = 0
+        self._hash = None
+        self._task = None
+        self._segments = None
+
+        # Time and size of the download when it started and when the
+        # progress was last reported, and the smoothed throughput.
+        self._progress_started = None
+        self._progress_reported = None
+        self._rate = None
+
+    def start(self):
+        """ Schedules the download and returns its task.
+        """
+        self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def run(self):
+        retries = 0
+        while True:
+            offset = self.offset
+            # A connection which dropped may not fill a grown chunk.
+            self.chunk_size = hpxqt_consts.DOWNLOAD_CHUNK_MIN
+            try:
+                await self._download()
+                await self._verify()
+                break
+            except DownloadError as e:
+                self.signal_download_failed.emit(str(e))
+                return
+            except RETRY_ERRORS as e:
+                # Only attempts which made no progress count as retries.
+                retries = 1 if self.offset > offset else retries + 1
+                if retries > hpxqt_consts.DOWNLOAD_RETRIES:
+                    self.signal_download_failed.emit(str(e) or e.__class__.__name__)
+                    return
+
+                logger.warning('Download interrupted at %d bytes: %r', self.offset, e)
+                await asyncio.sleep(min(hpxqt_consts.DOWNLOAD_RETRY_DELAY * 2 ** (retries - 1),
+                                        hpxqt_consts.DOWNLOAD_RETRY_DELAY_MAX))
+
+        self._report_progress(self.offset, force=True)
+        self.signal_download_finished.emit(hpxqt_consts.FINISHED_DOWNLOAD)
+
+    def progress(self, received, now=None):
+        """ Progress of the download having ``received`` bytes. Rates are
+        in bytes per second, ``eta`` in seconds. ``total`` and ``eta`` are
+        None while the size is unknown.
+        """
+        now = time.monotonic() if now is None else now
+        started, started_received = self._progress_started
+        reported, reported_received = self._progress_reported
+
+        rate = 0.0
+        if now > reported:
+            rate = (received - reported_received) / (now - reported)
+        average_rate = 0.0
+        if now > started:
+            average_rate = (received - started_received) / (now - started)
+
+        # The estimate follows a smoothed rate, so it does not jump with
+        # every burst.
+        smoothed = self._rate = rate if self._rate is None else 0.7 * self._rate + 0.3 * rate
 
-    def __del__(self):
-        self.wait()
+        eta = None
+        if self.total is not None:
+            remaining = max(self.total - received, 0)
+            if not remaining:
+                eta = 0.0
+            elif smoothed > 0:
+                eta = remaining / smoothed
+
+        return dict(received=received,
+                    total=self.total,
+                    rate=rate,
+                    average_rate=average_rate,
+                    eta=eta)
+
+    def _report_progress(self, received, force=False):
+        now = time.monotonic()
+        if self._progress_started is None:
+            self._progress_started = self._progress_reported = (now, received)
+            return
 
-    def run(self):
-        response = requests.get(self.url, stream=True)
-        if response.status_code != 200:
+        if not force and now - self._progress_reported[0] < 1.0 / hpxqt_consts.DOWNLOAD_PROGRESS_RATE:
             return
 
-        with open(self.file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=1024):
+        progress = self.progress(received, now)
+        self._progress_reported = (now, received)
+        self.signal_download_progress.emit(hpxqt_consts.DOWNLOAD_PROGRESS, progress)
+
+    async def _download(self):
+        # Asked for from the start too, a 206 response tells the server
+        # supports ranges.
+        async with hpxqt_net.get_session().get(
+                self.url, headers={'Range': 'bytes=%d-' % self.offset}) as response:
+            self._report_progress(self.offset)
+
+            if response.status == 416 and self.offset:
+                # Nothing left to download if the file is complete.
+                if _content_range_total(response) == self.offset:
+                    return
+                await self._restart()
+                raise DownloadError('Invalid range of a partial download')
+
+            if response.status == 200:
+                # The server ignored the range.
+                self.offset = 0
+                self._hash = None
+                self._notify_written(0)
+            elif response.status != 206 or _content_range_start(response) != self.offset:
+                raise DownloadError('Unexpected response %d for %s'
+                                    % (response.status, self.url))
+
+            total = _content_range_total(response)
+            if total is None and response.content_length is not None:
+                total = self.offset + response.content_length
+            self.total = total
+
+            if (response.status == 206 and total
+                    and total - self.offset >= 2 * hpxqt_consts.DOWNLOAD_SEGMENT_MIN):
+                await self._write_segments(response, total)
+            else:
+                await self._write(response)
+
+    async def _write(self, response):
+        mode = 'r+b' if self.offset and os.path.exists(self.file_path) else 'wb'
+        saved = self.offset
+        total = self.total
+
+        # Unbuffered, so whatever was written can be read back at once.
+        with open(self.file_path, mode, buffering=0) as f:
+            await _run_in_executor(self._prepare_file, f, total)
+
+            while True:
+                started = time.monotonic()
+                chunk, error = await _read_chunk(response.content, self.chunk_size)
+                if chunk:
+                    if error is None:
+                        self.chunk_size = _adapt_chunk_size(self.chunk_size, len(chunk),
+                                                            time.monotonic() - started)
+
+                    await _run_in_executor(self._write_chunk, f, chunk)
+                    self.offset += len(chunk)
+                    self._notify_written(self.offset)
+                    self._report_progress(self.offset)
+
+                if error is not None:
+                    await self._save_progress()
+                    raise error
                 if not chunk:
-                    continue
-                f.write(chunk)
-        self.signal_download_finished.emit(hpxqt_consts.FINISHED_DOWNLOAD)
+                    break
+
+                if self.offset - saved >= hpxqt_consts.DOWNLOAD_PROGRESS_BYTES:
+                    saved = self.offset
+                    await self._save_progress()
+
+            # Drop the preallocated space a short response did not fill.
+            await _run_in_executor(f.truncate)
+
+        await self._save_progress()
+        if total and self.offset < total:
+            raise IOError('Download ended at %d of %d bytes' % (self.offset, total))
+
+    def _prepare_file(self, f, total):
+        self._hash_existing(f)
+
+        f.seek(self.offset)
+        f.truncate()
+        if total:
+            _preallocate(f, total)
+
+    def _write_chunk(self, f, chunk):
+        f.write(chunk)
+        self._hash.update(chunk)
+
+    def _hash_existing(self, f):
+        """ Hashes the first ``offset`` bytes of a resumed download, so the
+        digest covers the whole file. They are read once per download.
+        """
+        if self._hash is not None:
+            return
+
+        self._hash = hashlib.sha256()
+        f.seek(0)
+        remaining = self.offset
+        while remaining:
+            chunk = f.read(min(remaining, hpxqt_consts.DOWNLOAD_CHUNK_MAX))
+            if not chunk:
+                break
+            self._hash.update(chunk)
+            remaining -= len(chunk)
+
+    async def _write_segments(self, response, total):
+        """ Fetches ``[offset, total)`` in segments over a growing number
+        of connections. ``response`` serves the first segment. Failed
+        segments are retried from where they stopped.
+
+        The saved progress is the part of the file written without gaps,
+        so an interrupted download resumes from it.
+        """
+        offset = self.offset
+        remaining = total - offset
+        size = max(hpxqt_consts.DOWNLOAD_SEGMENT_MIN,
+                   -(-remaining // (2 * hpxqt_consts.DOWNLOAD_SEGMENTS_MAX)))
+        segments = [_Segment(start, min(start + size, total))
+                    for start in range(offset, total, size)]
+        segments[0].response = response
+        pending = collections.deque(segments)
+        self._segments = segments
+
+        await _run_in_executor(_allocate_file, self.file_path, total)
+
+        # Segments arrive out of order, the digest is computed from the
+        # finished file.
+        self._hash = None
+
+        errors = []
+        workers = set()
+        target = min(2, hpxqt_consts.DOWNLOAD_SEGMENTS_MAX)
+        saved = offset
+        measured = None
+        throughput = 0.0
+
+        try:
+            while True:
+                workers = {worker for worker in workers if not worker.done()}
+                if errors or (not workers and not pending):
+                    break
+
+                for _ in range(min(target - len(workers), len(pending))):
+                    workers.add(asyncio.ensure_future(
+                        self._segment_worker(pending, errors)))
+                self.connections = max(self.connections, len(workers))
+
+                await asyncio.wait(workers, timeout=hpxqt_consts.DOWNLOAD_SEGMENT_INTERVAL,
+                                   return_when=asyncio.FIRST_COMPLETED)
+
+                done = sum(segment.pos - segment.start for segment in segments)
+                now = time.monotonic()
+                if measured is not None and now > measured[0]:
+                    rate = (done - measured[1]) / (now - measured[0])
+                    # Open another connection as long as the last one paid off.
+                    if (rate > throughput * hpxqt_consts.DOWNLOAD_SEGMENT_GAIN
+                            and target < hpxqt_consts.DOWNLOAD_SEGMENTS_MAX):
+                        target += 1
+                    throughput = max(throughput, rate)
+                measured = now, done
+                self._report_progress(offset + done)
+
+                self.offset = _written_prefix(segments, total)
+                if self.offset - saved >= hpxqt_consts.DOWNLOAD_PROGRESS_BYTES:
+                    saved = self.offset
+                    await self._save_progress()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            if workers:
+                await asyncio.wait(workers)
+            for segment in segments:
+                if segment.response is not None:
+                    segment.response.release()
+
+        self.offset = _written_prefix(segments, total)
+        await self._save_progress()
+        if errors:
+            raise errors[0]
+
+    async def _segment_worker(self, pending, errors):
+        try:
+            # Unbuffered, so the saved progress is never ahead of the file.
+            with open(self.file_path, 'r+b', buffering=0) as f:
+                while pending and not errors:
+                    segment = pending.popleft()
+                    pos = segment.pos
+                    try:
+                        await self._fetch_segment(f, segment, errors)
+                    except RETRY_ERRORS as e:
+                        segment.failures = 1 if segment.pos > pos else segment.failures + 1
+                        if segment.failures > hpxqt_consts.DOWNLOAD_RETRIES:
+                            raise
+                        logger.warning('Download segment interrupted at %d bytes: %r',
+                                       segment.pos, e)
+                        pending.append(segment)
+        except Exception as e:
+            errors.append(e)
+
+    async def _fetch_segment(self, f, segment, errors):
+        response, segment.response = segment.response, None
+        if response is None:
+            response = await hpxqt_net.get_session().get(
+                self.url, headers={'Range': 'bytes=%d-%d' % (segment.pos, segment.end - 1)})
+            if response.status != 206 or _content_range_start(response) != segment.pos:
+                response.release()
+                raise DownloadError('Unexpected response %d for a range of %s'
+                                    % (response.status, self.url))
+
+        chunk_size = hpxqt_consts.DOWNLOAD_CHUNK_MIN
+        try:
+            while segment.pos < segment.end and not errors:
+                started = time.monotonic()
+                chunk, error = await _read_chunk(response.content,
+                                                 min(chunk_size, segment.end - segment.pos))
+                if chunk:
+                    if error is None:
+                        chunk_size = _adapt_chunk_size(chunk_size, len(chunk),
+                                                       time.monotonic() - started)
+
+                    await _run_in_executor(_write_at, f, segment.pos, chunk)
+                    segment.pos += len(chunk)
+                    self._notify_written(_written_prefix(self._segments, self.total))
+
+                if error is not None:
+                    raise error
+                if not chunk:
+                    raise IOError('Download segment ended at %d of %d bytes'
+                                  % (segment.pos, segment.end))
+        finally:
+            response.release()
+
+    async def _verify(self):
+        if self.sha256 is None:
+            return
+
+        if self._hash is None:
+            # The file was already complete or downloaded in segments.
+            with open(self.file_path, 'rb') as f:
+                await _run_in_executor(self._hash_existing, f)
+
+        digest = self._hash.hexdigest()
+        if digest != self.sha256:
+            await self._restart()
+            raise DownloadError('Checksum mismatch for %s: expected sha256 %s, got %s'
+                                % (self.url, self.sha256, digest))
+
+    async def _restart(self):
+        self.offset = 0
+        self._hash = None
+        self._notify_written(0)
+        await self._save_progress()
+
+    def _notify_written(self, written):
+        if self.on_written is not None:
+            self.on_written(written)
+
+    async def _save_progress(self):
+        if self.save_progress is not None:
+            await _run_in_executor(self.save_progress, self.offset)
+
+
+def _run_in_executor(func, *args):
+    return asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+async def _read_chunk(content, size):
+    """ Reads ``size`` bytes of the response body, less only at its end.
+    Returns them with the error which interrupted the read, if any, so
+    the data which arrived before a dropped connection is kept.
+    """
+    parts = []
+    length = 0
+    error = None
+    try:
+        while length < size:
+            data = await content.read(size - length)
+            if not data:
+                break
+            parts.append(data)
+            length += len(data)
+    except RETRY_ERRORS as e:
+        error = e
+        data = _buffered_data(content, size - length)
+        if data:
+            parts.append(data)
+
+    chunk = parts[0] if len(parts) == 1 else b''.join(parts)
+    return chunk, error
+
+
+def _buffered_data(content, size):
+    """ Up to ``size`` bytes aiohttp buffered before the body failed. Its
+    readers raise the error first, even when the data came in along with
+    the dropped connection, so they are taken from the buffer.
+    """
+    read_nowait = getattr(content, '_read_nowait', None)
+    if read_nowait is None:
+        return b''
+    try:
+        return read_nowait(size)
+    except RETRY_ERRORS:
+        return b''
+
+
+def _write_at(f, pos, data):
+    f.seek(pos)
+    f.write(data)
+
+
+def _allocate_file(path, size):
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.truncate(size)
+        _preallocate(f, size)
+
+
+def _adapt_chunk_size(chunk_size, length, elapsed):
+    """ Returns the size of the next chunk. A full chunk read faster than
+    ``DOWNLOAD_CHUNK_TIME`` means the connection can fill a larger one,
+    a slow read asks for less.
+    """
+    if length == chunk_size and elapsed < hpxqt_consts.DOWNLOAD_CHUNK_TIME / 2:
+        return min(chunk_size * 2, hpxqt_consts.DOWNLOAD_CHUNK_MAX)
+    if elapsed > hpxqt_consts.DOWNLOAD_CHUNK_TIME * 2:
+        return max(chunk_size // 2, hpxqt_consts.DOWNLOAD_CHUNK_MIN)
+    return chunk_size
+
+
+def _written_prefix(segments, total):
+    """ End of the part of the file written without gaps.
+    """
+    for segment in segments:
+        if segment.pos < segment.end:
+            return segment.pos
+    return total
+
+
+def _preallocate(f, size):
+    """ Reserves ``size`` bytes for the file, so the disk space is
+    allocated at once instead of with every write.
+    """
+    f.flush()
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except (AttributeError, OSError):
+        # Not available on Windows and some file systems.
+        pass
+
+
+def _content_range_start(response):
+    match = re.match(r'bytes (\d+)-', response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+
+def _content_range_total(response):
+    match = re.match(r'bytes [^/]+/(\d+)', response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+
+class ArchiveStream(io.RawIOBase):
+    """ Reads the file at ``path`` while a ``Downloader`` writes it. Reads
+    block until the bytes were written, ``advance`` is meant to be its
+    ``on_written`` callback. Once the download is over, ``finish`` turns
+    the end of the written part into the end of the stream.
+    """
+
+    def __init__(self, path, written=0):
+        super().__init__()
+        self.path = path
+
+        self._file = None
+        self._pos = 0
+        self._written = written
+        self._finished = False
+        self._error = None
+        self._condition = threading.Condition()
+
+    def advance(self, written):
+        with self._condition:
+            if written < self._written and self._error is None:
+                # What was read may have been overwritten.
+                self._error = IOError('Download of %s restarted' % self.path)
+            self._written = max(self._written, written)
+            self._condition.notify_all()
+
+    def finish(self, error=None):
+        with self._condition:
+            self._finished = True
+            if self._error is None:
+                self._error = error
+            self._condition.notify_all()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        with self._condition:
+            while (self._pos >= self._written and not self._finished
+                   and self._error is None):
+                self._condition.wait()
+            if self._error is not None:
+                raise self._error
+            available = self._written - self._pos
+
+        if available <= 0:
+            return 0
+
+        if self._file is None:
+            self._file = open(self.path, 'rb', buffering=0)
+        self._file.seek(self._pos)
+        read = self._file.readinto(memoryview(buffer)[:available])
+        self._pos += read
+        return read
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _archive_parts(name, symlinks, base=()):
+    """ Resolves an archive path relative to the ``base`` components into
+    its components, refusing paths that are absolute, climb out of the
+    archive root or go through one of the ``symlinks`` extracted so far.
+    """
+    if name.startswith('/') or os.path.isabs(name) or os.path.splitdrive(name)[0]:
+        raise ArchiveError('Absolute path in update archive: %r' % name)
+
+    parts = list(base)
+    for part in name.split('/'):
+        if part in ('', '.'):
+            continue
+        if parts and tuple(parts) in symlinks:
+            raise ArchiveError('Path through a link in update archive: %r'
+                               % name)
+        if part == '..':
+            if not parts:
+                raise ArchiveError('Path outside of update archive: %r'
+                                   % name)
+            parts.pop()
+        else:
+            parts.append(part)
+    return parts
+
+
+def _check_member(member, symlinks):
+    """ Validates ``member`` against the archive root and returns its path
+    components.
+    """
+    if member.isdev():
+        raise ArchiveError('Device file in update archive: %r' % member.name)
+
+    names = [member.name]
+    if member.islnk():
+        # Relative to the archive root.
+        names.append(member.linkname)
+    for name in names:
+        if '..' in name.split('/'):
+            raise ArchiveError('Path outside of update archive: %r' % name)
+
+    parts = _archive_parts(member.name, symlinks)
+    if tuple(parts) in symlinks:
+        # tarfile would write to the target of the link.
+        raise ArchiveError('Member replaces a link in update archive: %r'
+                           % member.name)
+
+    if member.issym():
+        # Relative to the directory holding the link.
+        _archive_parts(member.linkname, symlinks, base=parts[:-1])
+    elif member.islnk():
+        _archive_parts(member.linkname, symlinks)
+    return parts
+
+
+def extract_archive(tar, path):
+    """ Extracts the members of ``tar`` into ``path`` in a single pass,
+    refusing any member that would land outside of it. Members are
+    dropped as soon as they are extracted, so memory use does not grow
+    with the size of the archive. Returns the path of the top-level entry
+    holding the last member.
+    """
+    extract_kwargs = {}
+    if hasattr(tarfile, 'data_filter'):
+        # Checks the members against the files on disk as well.
+        extract_kwargs['filter'] = 'data'
+
+    top = None
+    symlinks = set()
+    for member in tar:
+        # tarfile keeps every member it has read.
+        tar.members = []
+
+        parts = _check_member(member, symlinks)
+        if not parts:
+            continue
+        # Directories keep default permissions, read-only ones could not
+        # be filled otherwise.
+        tar.extract(member, path, set_attrs=not member.isdir(),
+                    **extract_kwargs)
+        if member.issym():
+            symlinks.add(tuple(parts))
+        top = parts[0]
+
+    if top is None:
+        raise tarfile.ReadError('Empty update archive')
+    return os.path.join(path, top)
+
+
+def _extract_stream(stream, path):
+    """ Extracts the tar archive read from ``stream`` into ``path`` member
+    by member, as it arrives. Returns the path of its top-level entry.
+    """
+    with io.BufferedReader(stream, hpxqt_consts.DOWNLOAD_CHUNK_MIN) as fileobj, \
+            tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+        return extract_archive(tar, path)
 
 
 class WindowUpdateMixIn(object):
@@ -43,12 +704,20 @@ class WindowUpdateMixIn(object):
 
         self.app_dir = hpxqt_utils.get_app_dir()
         self.app_path = os.path.join(self.app_dir, hpxqt_consts.APP_NAME_MAP[_os])
-        self.download_thread = None
+        self.downloader = None
         self.last_update = None
 
         self.download_dir = None
         self.download_file = None
 
+        # Linux archives are extracted while they are downloaded.
+        self.archive_stream = None
+        self.extraction = None
+        self.extraction_dir = None
+        self.extracted_path = None
+        # Latest ``Downloader.progress`` of the running download.
+        self.download_progress_status = None
+
         self.signal_upgrade_status_change.connect(self.upgrade_status_change)
 
         self._remove_old_executable()
@@ -56,19 +725,164 @@ class WindowUpdateMixIn(object):
     def start_upgrade(self):
         self.last_update = self.router.db_manager.last_update()
 
+        # Downloads are kept outside of the temporary directory, so an
+        # interrupted one can be resumed after a restart.
         self.download_dir = tempfile.TemporaryDirectory()
-        self.download_file = os.path.join(self.download_dir.name, self.last_update.url.rsplit('/', maxsplit=1)[-1])
+        self.download_file = os.path.join(hpxqt_utils.get_download_dir_path(),
+                                          self.last_update.url.rsplit('/', maxsplit=1)[-1])
 
-        if self.last_update.is_downloaded:
+        if self.last_update.is_downloaded and os.path.exists(self.download_file):
             self.signal_upgrade_status_change.emit(hpxqt_consts.START_INSTALL)
             return
 
+        self.download_progress_status = None
         self.signal_upgrade_status_change.emit(hpxqt_consts.START_DOWNLOAD)
-        self.download_thread = DownloadThread(self.last_update.url,
-                                              self.download_file)
-        self.download_thread.signal_download_finished.connect(
+        if not self._start_delta_download():
+            self._start_full_download()
+
+    def _start_full_download(self):
+        partial_file = '%s.part' % self.download_file
+        offset = 0
+        if self.last_update.download_path == partial_file and os.path.exists(partial_file):
+            offset = min(self.last_update.downloaded_bytes, os.path.getsize(partial_file))
+
+        on_written = None
+        if self.last_update.platform == hpxqt_consts.LINUX_OS:
+            self.archive_stream = ArchiveStream(partial_file, written=offset)
+            self.extraction_dir = tempfile.mkdtemp(dir=self.download_dir.name)
+            self.extraction = asyncio.ensure_future(_run_in_executor(
+                _extract_stream, self.archive_stream, self.extraction_dir))
+            on_written = self.archive_stream.advance
+
+        self.downloader = Downloader(
+            self.last_update.url, partial_file, offset=offset,
+            save_progress=functools.partial(self.router.db_manager.set_download_progress,
+                                            self.last_update.version,
+                                            partial_file),
+            sha256=self.last_update.sha256,
+            on_written=on_written)
+        self.downloader.signal_download_finished.connect(
+            self.upgrade_status_change)
+        self.downloader.signal_download_failed.connect(
+            self.download_failed)
+        self.downloader.signal_download_progress.connect(
+            self.upgrade_status_change)
+        task = self.downloader.start()
+        if self.archive_stream is not None:
+            task.add_done_callback(functools.partial(self._download_done,
+                                                     self.archive_stream))
+
+    def _download_done(self, stream, task):
+        """ Ends the archive stream of a download which stopped without a
+        signal, its extraction thread waits for the rest of the archive.
+        """
+        if task.cancelled():
+            error = DownloadError('Update download cancelled')
+        elif task.exception() is not None:
+            error = DownloadError(str(task.exception()))
+        else:
+            return
+
+        stream.finish(error)
+        if stream is self.archive_stream:
+            asyncio.ensure_future(self._finish_extraction(error))
+
+    def cancel_upgrade(self):
+        """ Stops a running update download. The archive stream is ended
+        at once, the event loop may not get to run the callbacks of the
+        cancelled download on shutdown.
+        """
+        if self.downloader is not None:
+            self.downloader.cancel()
+        if self.archive_stream is not None:
+            self.archive_stream.finish(DownloadError('Update download cancelled'))
+
+    def _delta_base_path(self, base_version=version):
+        """ Artifact of the installed version which patches apply to.
+        The Windows executable is the artifact itself, the archives of
+        other platforms are kept after their installation.
+        """
+        if hpxqt_utils.get_os() == hpxqt_consts.WINDOWS_OS:
+            return self.app_path
+        return os.path.join(hpxqt_utils.get_download_dir_path(), '%s.base' % base_version)
+
+    def _start_delta_download(self):
+        """ Downloads the patch from the installed version, if the update
+        offers one. Returns False when the full artifact is needed.
+        """
+        update = self.last_update
+        # Without the hash of the full artifact a patched one can not
+        # be verified.
+        if not update.delta_url or not update.sha256:
+            return False
+        if not os.path.exists(self._delta_base_path()):
+            return False
+
+        self.downloader = Downloader(update.delta_url,
+                                     '%s.delta' % self.download_file,
+                                     sha256=update.delta_sha256 or None)
+        self.downloader.signal_download_finished.connect(
+            self.delta_downloaded)
+        self.downloader.signal_download_failed.connect(
+            self.delta_failed)
+        self.downloader.signal_download_progress.connect(
             self.upgrade_status_change)
-        self.download_thread.start()
+        self.downloader.start()
+        return True
+
+    def delta_downloaded(self, kind):
+        asyncio.ensure_future(self._apply_delta())
+
+    def delta_failed(self, error):
+        logger.warning('Update patch download failed, downloading the full update: %s', error)
+        self._remove_file('%s.delta' % self.download_file)
+        self._start_full_download()
+
+    async def _apply_delta(self):
+        delta_file = '%s.delta' % self.download_file
+        patched_file = '%s.patched' % self.download_file
+
+        try:
+            digest = await _run_in_executor(hpxqt_delta.apply_patch,
+                                            self._delta_base_path(),
+                                            delta_file, patched_file)
+        except (hpxqt_delta.DeltaError, OSError) as e:
+            logger.warning('Update patch failed to apply: %s', e)
+            digest = None
+        finally:
+            self._remove_file(delta_file)
+
+        if digest != self.last_update.sha256.lower():
+            if digest is not None:
+                logger.warning('Patched update does not match its sha256, '
+                               'downloading the full update')
+            self._remove_file(patched_file)
+            self._start_full_download()
+            return
+
+        os.replace(patched_file, self.download_file)
+        self.router.db_manager.mark_downloaded(self.last_update.version)
+        self.process_installation()
+
+    def _keep_delta_base(self):
+        """ Keeps the installed archive, so the next update can be
+        downloaded as a patch against it.
+        """
+        base_path = self._delta_base_path(self.last_update.version)
+        if base_path == self.app_path or not os.path.exists(self.download_file):
+            return
+
+        os.replace(self.download_file, base_path)
+        download_dir = os.path.dirname(base_path)
+        for name in os.listdir(download_dir):
+            path = os.path.join(download_dir, name)
+            if name.endswith('.base') and path != base_path:
+                self._remove_file(path)
+
+    @staticmethod
+    def _remove_file(path):
+        if os.path.exists(path):
+            os.remove(path)
 
     def _rename_executable(self):
         os.rename(self.app_path, '%s.tmp' % self.app_path)
@@ -78,40 +892,89 @@ class WindowUpdateMixIn(object):
         if os.path.exists(tmp_app_path):
             os.remove(tmp_app_path)
 
-    def upgrade_status_change(self, kind):
+    def download_failed(self, error):
+        logger.error('Update download failed: %s', error)
+        if self.extraction is not None:
+            asyncio.ensure_future(self._finish_extraction(DownloadError(error)))
+
+    async def _finish_extraction(self, error=None):
+        """ Ends the archive stream and returns the path extracted from
+        it, or None if the archive has to be extracted from the file.
+        The archive is extracted before its checksum is verified, so the
+        extracted files are removed when the download failed.
+        """
+        extraction, self.extraction = self.extraction, None
+        stream, self.archive_stream = self.archive_stream, None
+        extraction_dir, self.extraction_dir = self.extraction_dir, None
+
+        stream.finish(error)
+        try:
+            extracted_path = await extraction
+        except Exception as e:
+            if error is None:
+                logger.warning('Update archive could not be extracted while '
+                               'downloading: %s', e)
+            extracted_path = None
+        finally:
+            stream.close()
+
+        if error is not None or extracted_path is None:
+            await _run_in_executor(shutil.rmtree, extraction_dir, True)
+            return None
+        return extracted_path
+
+    async def _finish_streamed_download(self):
+        self.extracted_path = await self._finish_extraction()
+
+        os.replace('%s.part' % self.download_file, self.download_file)
+        self.router.db_manager.mark_downloaded(self.last_update.version)
+        self.process_installation()
+
+    def download_progress(self, progress):
+        # Logged every tenth of the download.
+        previous, self.download_progress_status = self.download_progress_status, progress
+        if not progress['total']:
+            return
+
+        step = 10 * progress['received'] // progress['total']
+        if previous is not None and step == 10 * previous['received'] // progress['total']:
+            return
+
+        logger.info('Update download %d%% (%.1f MB of %.1f MB), %.2f MB/s, %s left',
+                    100 * progress['received'] // progress['total'],
+                    progress['received'] / 2 ** 20, progress['total'] / 2 ** 20,
+                    progress['rate'] / 2 ** 20,
+                    '%ds' % progress['eta'] if progress['eta'] is not None else 'unknown time')
+
+    def upgrade_status_change(self, kind, progress=None):
+        if kind == hpxqt_consts.DOWNLOAD_PROGRESS:
+            self.download_progress(progress)
+            return
+
+        if kind == hpxqt_consts.FINISHED_DOWNLOAD and self.extraction is not None:
+            asyncio.ensure_future(self._finish_streamed_download())
+            return
+
         if kind == hpxqt_consts.FINISHED_DOWNLOAD:
+            os.replace('%s.part' % self.download_file, self.download_file)
             self.router.db_manager.mark_downloaded(self.last_update.version)
 
         if kind in [hpxqt_consts.START_INSTALL, hpxqt_consts.FINISHED_DOWNLOAD]:
             self.process_installation()
 
     def process_linux(self):
-        with tarfile.open(self.download_file) as tar:
-            # specify path explicitly to extract files to download_dir
-            def is_within_directory(directory, target):
-                
-                abs_directory = os.path.abspath(directory)
-                abs_target = os.path.abspath(target)
-            
-                prefix = os.path.commonprefix([abs_directory, abs_target])
-                
-                return prefix == abs_directory
-            
-            def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-            
-                for member in tar.getmembers():
-                    member_path = os.path.join(path, member.name)
-                    if not is_within_directory(path, member_path):
-                        raise Exception("Attempted Path Traversal in Tar File")
-            
-                tar.extractall(path, members, numeric_owner=numeric_owner) 
-                
-            
-            safe_extract(tar, path=os.path.join(self.download_dir.name))
-            # Get path to executable
-            src_dir = os.path.join(self.download_dir.name, tar.getnames()[-1])
+        src_dir, self.extracted_path = self.extracted_path, None
+        if src_dir is not None:
+            # Extracted while it was downloaded.
             self._rename_executable()
             shutil.move(src_dir, self.app_path)
+            return
+
+        with tarfile.open(self.download_file, mode='r|*') as tar:
+            # specify path explicitly to extract files to download_dir
+            src_dir = extract_archive(tar, self.download_dir.name)
+        self._rename_executable()
+        shutil.move(src_dir, self.app_path)
 
     def process_osx(self):
         self._rename_executable()
@@ -129,6 +992,7 @@ class WindowUpdateMixIn(object):
         """
         getattr(self, 'process_%s' % self.last_update.platform)()
         self.download_dir.cleanup()
+        self._keep_delta_base()
 
         self.router.db_manager.remove_downloaded(self.last_update.version)
         self.router.db_manager.mark_installed(self.last_update.version)
@@ -1,3 +1,4 @@
+import collections.abc
 import logging
 import os
 import pathlib
@@ -6,8 +7,6 @@ import sys
 from decimal import Decimal
 from zipfile import ZipFile, ZipInfo
 
-from PyQt5.QtWidgets import QApplication
-
 from hpxclient import settings as hpxclient_settings
 from hpxqt import consts as hpxqt_consts
 
@@ -28,6 +27,47 @@ def get_os():
     return _os
 
 
+def get_host_binary_key():
+    """ Returns the ``(platform, arch)`` index key of the binaries which
+    run on this host, see ``binary_key``.
+    """
+    _os = get_os()
+    if _os == hpxqt_consts.MAC_OS:
+        return _os, ''
+    return _os, hpxqt_consts.ARCH_MAP.get(platform.architecture()[0], '')
+
+
+def binary_key(b_platform, b_arch):
+    """ Normalizes the platform and arch of a manifest binary.
+
+    Platforms are compared case-insensitively. The arch of macOS binaries
+    is ignored, elsewhere it is reduced to the first ``ARCH_MAP`` value it
+    contains, e.g. 'x86_64' becomes '64'.
+    """
+    b_platform = b_platform.lower()
+    if b_platform == hpxqt_consts.MAC_OS:
+        return b_platform, ''
+
+    b_arch = b_arch.lower()
+    for bits in hpxqt_consts.ARCH_MAP.values():
+        if bits in b_arch:
+            return b_platform, bits
+    return b_platform, b_arch
+
+
+def index_binaries(binaries, channel=hpxqt_consts.UPDATE_CHANNEL):
+    """ Indexes manifest binaries by ``binary_key``. Binaries of another
+    channel are skipped, binaries without one belong to every channel.
+    The first binary of a key wins.
+    """
+    index = {}
+    for binary in binaries:
+        if binary.get('channel', channel) != channel:
+            continue
+        index.setdefault(binary_key(binary['platform'], binary['arch']), binary)
+    return index
+
+
 def get_data_dir():
     if getattr(sys, 'frozen', None):
         meipass = getattr(sys, '_MEIPASS', None)
@@ -74,20 +114,34 @@ def get_chainprox_dir_path():
     return chainprox_dir
 
 
+def get_download_dir_path():
+    download_dir = os.path.join(get_chainprox_dir_path(), 'downloads')
+    if not os.path.exists(download_dir):
+        os.mkdir(download_dir)
+
+    return download_dir
+
+
 def get_db_file_path():
     return os.path.join(get_chainprox_dir_path(), 'db.sqlite3')
 
 
+def get_application():
+    # Imported here, so that the headless daemon never loads Qt.
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance()
+
+
 def get_login_window():
-    return QApplication.instance()._chainprox_login_window
+    return get_application()._chainprox_login_window
 
 
 def get_system_tray():
-    return QApplication.instance()._chainprox_system_tray
+    return get_application()._chainprox_system_tray
 
 
 def get_chainprox_manager():
-    return QApplication.instance()._chainprox_manager
+    return get_application()._chainprox_manager
 
 
 def convert_bytes(data):
@@ -98,6 +152,81 @@ def convert_bytes(data):
     return data
 
 
+def lazy_bytes(data):
+    """ Lazy counterpart of ``convert_bytes``. Containers are wrapped in
+    views which decode their items on first access.
+    """
+    if isinstance(data, bytes): return data.decode('ascii')
+    if isinstance(data, dict): return MessageView(data)
+    if isinstance(data, (tuple, list)): return SequenceView(data)
+    return data
+
+
+class MessageView(collections.abc.Mapping):
+    """ Read-only view of a raw message with bytes keys and values.
+    Keys and values are decoded only when accessed and the result is
+    cached, so reading one field does not walk the whole message.
+    """
+    __slots__ = ('_data', '_cache')
+
+    def __init__(self, data):
+        self._data = data
+        self._cache = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        try:
+            value = self._data[key.encode('ascii') if isinstance(key, str) else key]
+        except KeyError:
+            value = self._data[key]
+
+        value = self._cache[key] = lazy_bytes(value)
+        return value
+
+    def __iter__(self):
+        for key in self._data:
+            yield key.decode('ascii') if isinstance(key, bytes) else key
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self._data)
+
+
+class SequenceView(collections.abc.Sequence):
+    """ Read-only view of a raw list or tuple, see ``MessageView``.
+    """
+    __slots__ = ('_data', '_cache')
+
+    def __init__(self, data):
+        self._data = data
+        self._cache = {}
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._data)))]
+
+        if index < 0:
+            index += len(self._data)
+
+        try:
+            return self._cache[index]
+        except KeyError:
+            value = self._cache[index] = lazy_bytes(self._data[index])
+            return value
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self._data)
+
+
 def restart_program():
     try:
         sys.stdout.flush()